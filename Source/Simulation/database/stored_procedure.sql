@@ -34,6 +34,9 @@ BEGIN
   -- Delete the monthly data
   DELETE FROM sim.monthlydata WHERE replicateid = REPLICATE_ID;
   
+  -- Delete any summary data
+  DELETE FROM sim.districtsummary WHERE replicateid = REPLICATE_ID;
+
   -- Delete any movement enteries
   DELETE FROM sim.districtmovement WHERE replicateid = REPLICATE_ID;
   DELETE FROM sim.movement WHERE replicateid = REPLICATE_ID;
@@ -106,3 +109,76 @@ BEGIN
   	RAISE NOTICE 'Complete';
 	
 END $BODY$;
+
+
+CREATE OR REPLACE PROCEDURE public.refresh_districtsummary()
+LANGUAGE 'plpgsql'
+
+AS $BODY$
+DECLARE
+record RECORD;
+BEGIN
+  -- Allocate some more space to work with, for the session since we commit as we go
+  SET work_mem = '100MB';
+
+  -- Decode the genotypes once, rather than matching the name for every row
+  DROP TABLE IF EXISTS genotypealleles;
+  CREATE TEMP TABLE genotypealleles AS
+  SELECT id, 
+    CASE WHEN name ~ '^.....Y..' THEN 1 ELSE 0 END AS y469,
+    CASE WHEN name ~ '^......V.' THEN 1 ELSE 0 END AS v675
+  FROM sim.genotype;
+
+  -- Summarize each of the completed replicates that are not already present,
+  -- committing after each one so an interrupted refresh keeps its progress
+  FOR record IN SELECT r.id FROM sim.replicate r 
+      WHERE r.endtime IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM sim.districtsummary ds WHERE ds.replicateid = r.id)
+      ORDER BY r.id LOOP
+    RAISE NOTICE 'Summarizing replicate %', record.id;
+
+    INSERT INTO sim.districtsummary
+    SELECT sd.replicateid, sd.dayselapsed, sd.district, 
+      sd.infectedindividuals, sd.clinicalepisodes, sd.treatments, sd.treatmentfailures,
+      coalesce(gd.occurrences_469y, 0), coalesce(gd.clinicaloccurrences_469y, 0), coalesce(gd.weightedoccurrences_469y, 0),
+      coalesce(gd.occurrences_675v, 0), coalesce(gd.clinicaloccurrences_675v, 0), coalesce(gd.weightedoccurrences_675v, 0)
+    FROM (
+      SELECT md.replicateid, md.dayselapsed, msd.location AS district,
+        sum(msd.infectedindividuals) AS infectedindividuals, 
+        sum(msd.clinicalepisodes) AS clinicalepisodes,
+        sum(msd.treatments) AS treatments,
+        sum(msd.treatmentfailures) AS treatmentfailures
+      FROM sim.monthlydata md
+        INNER JOIN sim.monthlysitedata msd ON msd.monthlydataid = md.id
+      WHERE md.replicateid = record.id
+      GROUP BY md.replicateid, md.dayselapsed, msd.location) sd
+    LEFT JOIN (
+      SELECT md.dayselapsed, mgd.location AS district,
+        sum(ga.y469 * mgd.occurrences) AS occurrences_469y,
+        sum(ga.y469 * mgd.clinicaloccurrences) AS clinicaloccurrences_469y,
+        sum(ga.y469 * mgd.weightedoccurrences) AS weightedoccurrences_469y,
+        sum(ga.v675 * mgd.occurrences) AS occurrences_675v,
+        sum(ga.v675 * mgd.clinicaloccurrences) AS clinicaloccurrences_675v,
+        sum(ga.v675 * mgd.weightedoccurrences) AS weightedoccurrences_675v
+      FROM sim.monthlydata md
+        INNER JOIN sim.monthlygenomedata mgd ON mgd.monthlydataid = md.id
+        INNER JOIN genotypealleles ga ON ga.id = mgd.genomeid
+      WHERE md.replicateid = record.id
+        AND ga.y469 + ga.v675 > 0
+      GROUP BY md.dayselapsed, mgd.location) gd ON (gd.dayselapsed = sd.dayselapsed
+        AND gd.district = sd.district);
+    COMMIT;
+  END LOOP;
+
+  -- Drop the temporary table
+  DROP TABLE genotypealleles;
+
+  -- Update the planner statistics for the new rows
+  ANALYZE sim.districtsummary;
+
+  -- Reset allocation
+  RESET work_mem;
+
+  -- Report complete
+  RAISE NOTICE 'Complete';
+END $BODY$;
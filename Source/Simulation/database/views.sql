@@ -55,4 +55,35 @@ CREATE OR REPLACE VIEW public.v_therapyrecords
      JOIN sim.monthlydata md ON md.id = tr.monthlydataid;
 
 ALTER TABLE public.v_therapyrecords
-    OWNER TO dbadmin;
\ No newline at end of file
+    OWNER TO dbadmin;
+
+-- Table: sim.districtsummary
+--
+-- Materialized district-month summary of the completed replicates, populated by
+-- CALL refresh_districtsummary() which only adds replicates not already present
+CREATE TABLE IF NOT EXISTS sim.districtsummary
+(
+    replicateid integer NOT NULL,
+    dayselapsed integer NOT NULL,
+    district integer NOT NULL,
+    infectedindividuals bigint,
+    clinicalepisodes bigint NOT NULL,
+    treatments bigint NOT NULL,
+    treatmentfailures bigint NOT NULL,
+    occurrences_469y bigint NOT NULL,
+    clinicaloccurrences_469y bigint NOT NULL,
+    weightedoccurrences_469y double precision NOT NULL,
+    occurrences_675v bigint NOT NULL,
+    clinicaloccurrences_675v bigint NOT NULL,
+    weightedoccurrences_675v double precision NOT NULL,
+    CONSTRAINT districtsummary_pkey PRIMARY KEY (replicateid, dayselapsed, district),
+    CONSTRAINT districtsummary_replicateid_fk FOREIGN KEY (replicateid)
+        REFERENCES sim.replicate (id) MATCH SIMPLE
+        ON UPDATE NO ACTION
+        ON DELETE NO ACTION
+)
+WITH ( OIDS = FALSE )
+TABLESPACE pg_default;
+
+ALTER TABLE sim.districtsummary
+    OWNER TO sim;
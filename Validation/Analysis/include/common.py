@@ -2,27 +2,25 @@
 #
 # Include file for the shared data between the spiking scripts.
 import csv
+import os
 import sys
 
 # Connection string for the database
 CONNECTION = 'host=masimdb.vmhost.psu.edu dbname=uganda user=sim password=sim connect_timeout=60'
 
-# Paths for reference data
-DISTRICTS_MAPPING = '../GIS/administrative/uga_districts.csv'
-MIS_MAPPING = '../GIS/administrative/uga_mis_mapping.csv'
-
-# Template and paths for the mutations
-MUTATIONS_TEMPLATE = '../GIS/mutations/uga_{}_mutations.csv'
-MUTATIONS_469Y = '../GIS/mutations/uga_469y_mutations.csv'
-MUTATIONS_675V = '../GIS/mutations/uga_675v_mutations.csv'
+# NOTE that the paths for the reference data are in reference.py
 
 # Path for the replicates data
 DEFAULT_REPLICATE_STUDY = 4
 REPLICATES_LIST = 'data/uga-replicates.csv'
+REPLICATES_MANIFEST = 'data/uga-replicates-manifest.jsonl'
+CATALOG_FILE = 'data/uga-replicates-catalog.npz'
 
 # Paths for the resulting data
 PLOTS_DIRECTORY = 'plots'
 SPIKING_DIRECTORY = 'data/spiking'
+METRICS_DIRECTORY = 'data/metrics'
+SCORES_FILE = 'data/uga-spike-scores.csv'
 
 # From the PSU-CIDD-MaSim-Support repository, relative to the base script
 sys.path.insert(1, '../../PSU-CIDD-MaSim-Support/Python/include')
@@ -37,7 +35,10 @@ def increment(row, col):
   return row, col
 
 def save_csv(filename, data):
-  with open(filename, 'w') as csvfile:
+  # Write to a temporary file first so an interrupted write doesn't leave a partial file
+  temporary = filename + '.tmp'
+  with open(temporary, 'w') as csvfile:
     writer = csv.writer(csvfile)
     for row in data:
-      writer.writerow(row)
\ No newline at end of file
+      writer.writerow(row)
+  os.replace(temporary, filename)
\ No newline at end of file
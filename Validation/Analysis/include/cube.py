@@ -0,0 +1,169 @@
+# cube.py
+#
+# Include file that defines the dense replicate x date x district x metric array
+# built from a store file. The values are kept in a memory-mapped file so that only
+# the slices that are used are read from disk, and each axis is integer indexed so
+# plots can slice the array rather than filtering a data frame. The files are only
+# worth keeping for the merged datasets, single replicates, such as the spike
+# studies, are small enough to be arranged in memory each time they are read.
+#
+# NOTE that this file is also used by the Plotting scripts, so it should only
+# NOTE depend upon NumPy.
+import numpy as np
+import os
+import shutil
+
+# The store is imported as part of the include package by the Analysis scripts, and
+# directly by the Plotting scripts
+try:
+  import include.store as store
+except ImportError:
+  import store
+
+# The columns of the store file that index the axes of the array
+REPLICATE, DATES, DISTRICT = 'replicateid', 'dayselapsed', 'district'
+
+# The columns of the store file that are the metrics of the array
+METRICS = [column for column in store.SCHEMA if column not in ['configurationid', REPLICATE, DATES, DISTRICT]]
+
+# The weighted occurrences used for the allele frequencies
+ALLELES = { '469Y' : 'weightedoccurrences_469y', '675V' : 'weightedoccurrences_675v', 'either' : 'weightedsum' }
+
+# The files in the cube directory
+EXTENSION = '.cube'
+VALUES, AXES = 'values.npy', 'axes.npz'
+
+
+def _axis(values):
+  # Return the labels in the order they first appear, and the index of each value
+  labels, first, inverse = np.unique(values, return_index = True, return_inverse = True)
+  order = np.argsort(first)
+  rank = np.empty_like(order)
+  rank[order] = np.arange(len(order))
+  return labels[order], rank[inverse.ravel()]
+
+
+def filename(path, source):
+  """Return the full path of the cube directory for the store file in the path."""
+  name = os.path.basename(source).replace(store.EXTENSION, '')
+  return os.path.join(path, name + EXTENSION)
+
+
+def _arrange(data, allocate):
+  # Arrange the store data into the (metric, replicate, date, district) values
+  # returned by allocate(shape), cells with no data are NaN
+  replicates, r = _axis(data[REPLICATE])
+  dates, d = _axis(data[DATES])
+  districts, k = _axis(data[DISTRICT])
+  values = allocate((len(METRICS), len(replicates), len(dates), len(districts)))
+  values[:] = np.nan
+  for ndx, metric in enumerate(METRICS):
+    values[ndx, r, d, k] = data[metric]
+  return values, { 'replicates' : replicates, 'dates' : dates, 'districts' : districts, 'metrics' : np.array(METRICS) }
+
+
+def build(source, target):
+  """Build the cube for the store file, cells with no data are NaN."""
+  data = store.arrays(source, [REPLICATE, DATES, DISTRICT] + METRICS)
+  stat = os.stat(source)
+
+  # Build under a temporary name so the cube is never left partially written, the
+  # values are stored metric first so each metric is contiguous on disk
+  temporary = target + '.tmp'
+  shutil.rmtree(temporary, ignore_errors = True)
+  os.makedirs(temporary)
+  values, axes = _arrange(data, lambda shape: np.lib.format.open_memmap(
+    os.path.join(temporary, VALUES), mode = 'w+', dtype = np.float64, shape = shape))
+  values.flush()
+  del values
+  np.savez(os.path.join(temporary, AXES), source = np.array([stat.st_size, stat.st_mtime_ns]), **axes)
+  shutil.rmtree(target, ignore_errors = True)
+  os.replace(temporary, target)
+
+
+def load(source, path):
+  """Return the cube for the store file, building it in the path if it does not
+  exist or the store file has changed since it was built."""
+  target = filename(path, source)
+  stat = os.stat(source)
+  try:
+    result = _open(target)
+    if result.source == (stat.st_size, stat.st_mtime_ns): return result
+  except (IOError, KeyError, ValueError):
+    pass
+  build(source, target)
+  return _open(target)
+
+
+def memory(source):
+  """Return the cube for the store file arranged in memory, nothing is written to
+  disk so this is intended for the individual replicates."""
+  data = store.arrays(source, [REPLICATE, DATES, DISTRICT] + METRICS)
+  values, axes = _arrange(data, lambda shape: np.empty(shape, dtype = np.float64))
+  stat = os.stat(source)
+  return cube(values, axes, (stat.st_size, stat.st_mtime_ns))
+
+
+def clean(path, sources = ()):
+  """Remove the cube directories in the path that are not for one of the store
+  files, along with any partial builds."""
+  if not os.path.isdir(path): return
+  keep = set(os.path.basename(filename(path, source)) for source in sources)
+  for entry in os.listdir(path):
+    if not (entry.endswith(EXTENSION) or entry.endswith(EXTENSION + '.tmp')): continue
+    if entry in keep or not os.path.isdir(os.path.join(path, entry)): continue
+    shutil.rmtree(os.path.join(path, entry), ignore_errors = True)
+
+
+def _open(directory):
+  # Return the cube in the directory, the values are memory-mapped
+  with np.load(os.path.join(directory, AXES)) as axes:
+    return cube(np.load(os.path.join(directory, VALUES), mmap_mode = 'r'), dict(axes), tuple(int(value) for value in axes['source']))
+
+
+class cube:
+  """Dense array of the replicate data with integer-indexed axes. The values are
+  (replicates, dates, districts, metrics), and the labels of each axis are in the
+  order they first appear in the store file."""
+
+  def __init__(self, values, axes, source):
+    self.replicates = axes['replicates']
+    self.dates = axes['dates']
+    self.districts = axes['districts']
+    self.metrics = axes['metrics'].tolist()
+    self.source = source
+    self.__values = values
+    self.__districts = { int(district) : ndx for ndx, district in enumerate(self.districts) }
+
+    # The array in axis order, this is a view so nothing is read from disk
+    self.values = np.moveaxis(self.__values, 0, -1)
+
+    # Only the axes are held in memory when the values are memory-mapped, since they
+    # are paged in as needed
+    self.nbytes = self.replicates.nbytes + self.dates.nbytes + self.districts.nbytes
+    if not isinstance(values, np.memmap): self.nbytes += values.nbytes
+
+  def district(self, id):
+    """Return the index of the district with the id."""
+    return self.__districts[int(id)]
+
+  def metric(self, name):
+    """Return the (replicates, dates, districts) values of the metric, this is a
+    view of the memory-mapped file."""
+    return self.__values[self.metrics.index(name)]
+
+  def national(self, name):
+    """Return the (replicates, dates) values of the metric summed over the districts."""
+    return self.metric(name).sum(axis = 2)
+
+  def frequency(self, allele, replicate = None):
+    """Return the (replicates, dates, districts) frequency of the allele, one of the
+    ALLELES keys, or the (dates, districts) frequency if the replicate index is given."""
+    index = slice(None) if replicate is None else replicate
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+      return self.metric(ALLELES[allele])[index] / self.metric('infectedindividuals')[index]
+
+  def failure_rate(self):
+    """Return the (replicates, dates, districts) fraction of treatments that failed."""
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+      return self.metric('treatmentfailures') / self.metric('treatments')
@@ -0,0 +1,90 @@
+# download.py
+#
+# Include file for the loaders that defines the worker pool used to download
+# replicates concurrently over a fixed pool of database connections.
+import concurrent.futures
+import psycopg2.pool
+import queue
+import time
+
+import include.common as shared
+from include.metrics import received
+
+# Number of seconds the progress reporting waits on the workers before checking
+# to see if they are all done
+POLL_INTERVAL = 1
+
+
+def query(connection, sql, parameters):
+  # Run the query on the connection provided and return all of the rows
+  cursor = connection.cursor()
+  cursor.execute(sql, parameters)
+  rows = cursor.fetchall()
+  cursor.close()
+  return rows
+
+
+def download(chunks, fetch, save, jobs, total, complete = 0, metrics = None):
+  """Download the replicates using a pool of workers that share a fixed pool of
+  database connections, returns the number of replicates complete.
+
+  chunks - A list of replicate id lists, each list is handled by a single worker
+  fetch - Function (connection, ids, callback) that queries for the replicates
+          and invokes callback(id, rows) once for each replicate
+  save - Function (id, rows) that stores a replicate, runs on the worker
+  jobs - The number of workers, and the maximum number of connections to open
+  total, complete - The totals to use for the progress bar
+  metrics - The metrics for the run, or None if they are not being recorded"""
+
+  def worker(ids):
+    def store(id, rows):
+      # The latency is the time since the previous replicate was stored, which
+      # for batches is the time spent waiting on the rows for this replicate
+      started = time.perf_counter()
+      latency = started - timer[0]
+      save(id, rows)
+      if metrics is not None:
+        metrics.replicate(id, latency, len(rows), received(rows), time.perf_counter() - started)
+      timer[0] = time.perf_counter()
+      finished.put(id)
+
+    connection, failed = pool.getconn(), True
+    try:
+      timer = [time.perf_counter()]
+      fetch(connection, ids, store)
+
+      # End the transaction before the connection is reused
+      connection.rollback()
+      failed = False
+    finally:
+      pool.putconn(connection, close = failed)
+
+  if len(chunks) == 0: return complete
+
+  # The workers report completed replicates through the queue so that the
+  # progress is only ever updated from this thread
+  finished = queue.Queue()
+  pool = psycopg2.pool.ThreadedConnectionPool(1, jobs, shared.CONNECTION)
+  try:
+    with concurrent.futures.ThreadPoolExecutor(max_workers = jobs) as executor:
+      futures = [executor.submit(worker, chunk) for chunk in chunks]
+      shared.progressBar(complete, total)
+      while True:
+        try:
+          finished.get(timeout = POLL_INTERVAL)
+          complete += 1
+          shared.progressBar(complete, total)
+        except queue.Empty:
+          if all(future.done() for future in futures): break
+
+      # Catch anything reported between the last check and the workers finishing
+      while not finished.empty():
+        finished.get()
+        complete += 1
+        shared.progressBar(complete, total)
+
+      # Raise any errors encountered by the workers
+      for future in futures: future.result()
+  finally:
+    pool.closeall()
+  return complete
@@ -0,0 +1,143 @@
+# genotypes.py
+#
+# Include file for the loaders that decodes the genotype table once into the sets
+# of genome ids carrying the 469Y and 675V alleles, and defines the replicate query
+# that aggregates the genome data with them in a single scan, along with the query
+# that reads the same data from the sim.districtsummary table.
+#
+# NOTE that this file is also used by ingest.py, so it should not depend upon psycopg2.
+import re
+import threading
+
+# The patterns used to identify the genotypes carrying the alleles
+ALLELE_469Y = re.compile('^.....Y..')
+ALLELE_675V = re.compile('^......V.')
+
+# The replicate query, the filter is expected to restrict the replicates returned
+# by both the monthly data and the replicate table. The genome data is scanned once
+# for the genomes carrying either allele, and the allele totals are computed with
+# conditional aggregation over the genome ids returned by decode(). The site data
+# is nullable, so missing values are reported as zero
+REPLICATE_SQL = """
+      SELECT *,
+        (weightedoccurrences_469y + weightedoccurrences_675v) as weightedsum,
+        (occurrences_469Y + occurrences_675v) as occurrences_sum
+      FROM (
+        SELECT c.id as configurationid, sd.replicateid, sd.dayselapsed,
+          sd.district, infectedindividuals,  clinicalepisodes,
+          coalesce(gd.occurrences_469y, 0) AS occurrences_469y,
+          coalesce(gd.clinicaloccurrences_469y, 0) AS clinicaloccurrences_469y,
+          coalesce(gd.weightedoccurrences_469y, 0) AS weightedoccurrences_469y,
+          coalesce(gd.occurrences_675v, 0) AS occurrences_675v,
+          coalesce(gd.clinicaloccurrences_675v, 0) AS clinicaloccurrences_675v,
+          coalesce(gd.weightedoccurrences_675v, 0) AS weightedoccurrences_675v,
+          treatments,
+          treatmentfailures
+        FROM (
+          SELECT md.replicateid, md.dayselapsed, msd.location AS district,
+            coalesce(sum(msd.infectedindividuals), 0) AS infectedindividuals,
+            coalesce(sum(msd.clinicalepisodes), 0) AS clinicalepisodes,
+            coalesce(sum(msd.treatments), 0) AS treatments,
+            coalesce(sum(msd.treatmentfailures), 0) as treatmentfailures
+          FROM sim.monthlydata md
+            INNER JOIN sim.monthlysitedata msd on msd.monthlydataid = md.id
+          WHERE md.replicateid {filter}
+            AND md.dayselapsed > (7 * 365)
+          GROUP BY md.replicateid, md.dayselapsed, msd.location) sd
+        LEFT JOIN (
+          SELECT md.replicateid, md.dayselapsed, mgd.location AS district,
+            sum(CASE WHEN mgd.genomeid = ANY(%(genomes469y)s) THEN mgd.occurrences ELSE 0 END) AS occurrences_469y,
+            sum(CASE WHEN mgd.genomeid = ANY(%(genomes469y)s) THEN mgd.clinicaloccurrences ELSE 0 END) AS clinicaloccurrences_469y,
+            sum(CASE WHEN mgd.genomeid = ANY(%(genomes469y)s) THEN mgd.weightedoccurrences ELSE 0 END) AS weightedoccurrences_469y,
+            sum(CASE WHEN mgd.genomeid = ANY(%(genomes675v)s) THEN mgd.occurrences ELSE 0 END) AS occurrences_675v,
+            sum(CASE WHEN mgd.genomeid = ANY(%(genomes675v)s) THEN mgd.clinicaloccurrences ELSE 0 END) AS clinicaloccurrences_675v,
+            sum(CASE WHEN mgd.genomeid = ANY(%(genomes675v)s) THEN mgd.weightedoccurrences ELSE 0 END) AS weightedoccurrences_675v
+          FROM sim.monthlydata md
+            INNER JOIN sim.monthlygenomedata mgd on mgd.monthlydataid = md.id
+          WHERE md.replicateid {filter}
+            AND md.dayselapsed > (7 * 365)
+            AND mgd.genomeid = ANY(%(genomes)s)
+          GROUP BY md.replicateid, md.dayselapsed, mgd.location) gd ON (gd.replicateid = sd.replicateid
+            AND gd.dayselapsed = sd.dayselapsed
+            AND gd.district = sd.district)
+          INNER JOIN sim.replicate r on r.id = sd.replicateid
+          INNER JOIN sim.configuration c on c.id = r.configurationid
+        WHERE r.endtime is not null
+          AND r.id {filter}) iq
+      ORDER BY replicateid, dayselapsed"""
+
+# The summary query, returns the same columns as the replicate query from the
+# district-month summary maintained by CALL refresh_districtsummary(), the summary
+# copies the site data as-is so the missing values are reported as zero here
+SUMMARY_SQL = """
+      SELECT r.configurationid, ds.replicateid, ds.dayselapsed, ds.district,
+        coalesce(ds.infectedindividuals, 0), coalesce(ds.clinicalepisodes, 0),
+        ds.occurrences_469y, ds.clinicaloccurrences_469y, ds.weightedoccurrences_469y,
+        ds.occurrences_675v, ds.clinicaloccurrences_675v, ds.weightedoccurrences_675v,
+        coalesce(ds.treatments, 0), coalesce(ds.treatmentfailures, 0),
+        (ds.weightedoccurrences_469y + ds.weightedoccurrences_675v) as weightedsum,
+        (ds.occurrences_469y + ds.occurrences_675v) as occurrences_sum
+      FROM sim.districtsummary ds
+        INNER JOIN sim.replicate r on r.id = ds.replicateid
+      WHERE ds.replicateid {filter}
+        AND ds.dayselapsed > (7 * 365)
+      ORDER BY ds.replicateid, ds.dayselapsed, ds.district"""
+
+# The decoded genome ids, shared by all of the workers in the process
+_lock = threading.Lock()
+_genomes = None
+
+
+def classify(name):
+  # Return a tuple of flags indicating if the genotype carries the 469Y and 675V alleles
+  return bool(ALLELE_469Y.match(name)), bool(ALLELE_675V.match(name))
+
+
+def decode(connection):
+  """Decode the genotype table into the genome ids carrying each allele, returns
+  a dictionary of parameters for REPLICATE_SQL. The genotype table is only queried
+  the first time this is called, after which the cached ids are returned."""
+  global _genomes
+  with _lock:
+    if _genomes is None:
+      cursor = connection.cursor()
+      cursor.execute('SELECT id, name FROM sim.genotype')
+      y469, v675 = [], []
+      for id, name in cursor.fetchall():
+        has469y, has675v = classify(name)
+        if has469y: y469.append(id)
+        if has675v: v675.append(id)
+      cursor.close()
+      _genomes = {
+        'genomes469y' : y469,
+        'genomes675v' : v675,
+        'genomes'     : sorted(set(y469) | set(v675))
+      }
+    return dict(_genomes)
+
+
+def queries(connection, replicateIds, summary):
+  """Split the replicates by the query used to extract them, returns a list of
+  (template, parameters, replicate ids) tuples where the template has yet to have
+  the filter applied. When summary is True the replicates present in the
+  sim.districtsummary table are read from it, and the rest are aggregated from
+  the raw data so replicates that have not been summarized yet are not lost."""
+  pending = list(replicateIds)
+  if summary and len(pending) != 0:
+    cursor = connection.cursor()
+    cursor.execute("""
+      SELECT r.id FROM sim.replicate r
+      WHERE r.id = ANY(%(replicateIds)s)
+        AND EXISTS (SELECT 1 FROM sim.districtsummary ds WHERE ds.replicateid = r.id)""",
+      {'replicateIds':pending})
+    present = set(row[0] for row in cursor.fetchall())
+    cursor.close()
+    summarized = [id for id in pending if id in present]
+    pending = [id for id in pending if id not in present]
+  else:
+    summarized = []
+
+  result = []
+  if len(summarized) != 0: result.append((SUMMARY_SQL, {}, summarized))
+  if len(pending) != 0: result.append((REPLICATE_SQL, decode(connection), pending))
+  return result
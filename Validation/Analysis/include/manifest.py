@@ -0,0 +1,141 @@
+# manifest.py
+#
+# Include file for the loaders that defines the manifest of the downloaded
+# replicates and merged datasets, which allows the loaders to resume an
+# interrupted run and to only update the data that has changed.
+#
+# The manifest is an append-only JSON lines file, so entries for replicates are
+# not lost if the loader is interrupted, the last entry for a replicate or
+# dataset is the current one.
+import hashlib
+import json
+import os
+import threading
+
+import include.store as store
+
+# Block size to use when calculating checksums
+BLOCK_SIZE = 1024 * 1024
+
+
+def checksum(filename):
+  """Return the SHA-256 checksum of the file."""
+  hash = hashlib.sha256()
+  with open(filename, 'rb') as file:
+    for block in iter(lambda: file.read(BLOCK_SIZE), b''):
+      hash.update(block)
+  return hash.hexdigest()
+
+
+class manifest:
+  def __init__(self, filename, verify = False):
+    """Load the manifest from the file, creating it if need be.
+
+    verify - True if the checksum of every replicate should be verified,
+             otherwise it is only checked when the size or time stamp changes"""
+    self.filename = filename
+    self.verify = verify
+    self.replicates, self.datasets = {}, {}
+    self.lock = threading.Lock()
+
+    if os.path.exists(filename):
+      with open(filename, 'r') as file:
+        for line in file:
+          try:
+            entry = json.loads(line)
+          except ValueError:
+            # Partial entry from an interrupted run
+            continue
+          if 'replicate' in entry: self.replicates[entry['replicate']] = entry
+          if 'dataset' in entry: self.datasets[entry['dataset']] = entry
+
+    # Compact the file to the current entries and open it for appending
+    temporary = filename + '.tmp'
+    with open(temporary, 'w') as file:
+      for entry in list(self.replicates.values()) + list(self.datasets.values()):
+        file.write(json.dumps(entry) + '\n')
+    os.replace(temporary, filename)
+    self.log = open(filename, 'a')
+
+  def close(self):
+    self.log.close()
+
+  def __append(self, entry):
+    self.log.write(json.dumps(entry) + '\n')
+    self.log.flush()
+
+  def __stat(self, filename):
+    stat = os.stat(filename)
+    return stat.st_size, stat.st_mtime_ns
+
+
+  def valid(self, replicate, filename, endtime):
+    """Check to see if the replicate file is present and matches the manifest.
+    Files without an entry, such as those from before the manifest existed, are
+    only added if their contents pass store.check, otherwise they are deleted so
+    the replicate is downloaded again."""
+    if not os.path.exists(filename): return False
+    entry = self.replicates.get(replicate)
+
+    if entry is None:
+      try:
+        rows = store.check(filename)
+      except Exception:
+        os.remove(filename)
+        return False
+      self.record(replicate, filename, rows, endtime)
+      return True
+
+    # The replicate was run again since we downloaded it
+    if entry['endtime'] != str(endtime): return False
+
+    # Only calculate the checksum if we need to
+    size, mtime = self.__stat(filename)
+    if not self.verify and entry['size'] == size and entry['mtime'] == mtime: return True
+    if checksum(filename) != entry['checksum']: return False
+
+    # Update the time stamp so the checksum isn't calculated again
+    self.record(replicate, filename, entry['rows'], endtime)
+    return True
+
+
+  def record(self, replicate, filename, rows, endtime):
+    """Record the replicate file that was written."""
+    size, mtime = self.__stat(filename)
+    entry = {
+      'replicate' : int(replicate),
+      'rows'      : rows,
+      'checksum'  : checksum(filename),
+      'endtime'   : str(endtime),
+      'size'      : size,
+      'mtime'     : mtime
+    }
+    with self.lock:
+      self.replicates[entry['replicate']] = entry
+      self.__append(entry)
+
+
+  def __signature(self, replicates):
+    # The signature of a dataset is based upon the checksums of the replicates in it
+    hash = hashlib.sha256()
+    for replicate in replicates:
+      hash.update('{}:{};'.format(replicate, self.replicates[replicate]['checksum']).encode())
+    return hash.hexdigest()
+
+  def current(self, dataset, filename, replicates):
+    """Check to see if the dataset file was merged from the replicates as they are now."""
+    entry = self.datasets.get(dataset)
+    if entry is None or not os.path.exists(filename): return False
+    if any(replicate not in self.replicates for replicate in replicates): return False
+    return entry['signature'] == self.__signature(replicates)
+
+  def merged(self, dataset, replicates):
+    """Record the dataset as having been merged from the replicates."""
+    entry = {
+      'dataset'   : dataset,
+      'signature' : self.__signature(replicates),
+      'replicates': len(replicates)
+    }
+    with self.lock:
+      self.datasets[dataset] = entry
+      self.__append(entry)
@@ -0,0 +1,122 @@
+# metrics.py
+#
+# Include file for the loaders that records the throughput and latency of a run
+# so that slow runs can be attributed to the database, the network, or the disk.
+#
+# Each run writes a JSON lines file with one entry per replicate downloaded and per
+# replicate merged, followed by a summary entry that is also printed at the end of
+# the run.
+import datetime
+import json
+import os
+import threading
+import numpy as np
+import time
+
+import include.store as store
+
+# Percentiles reported in the summary
+PERCENTILES = [50, 95]
+
+# The width of a row of the replicate query, in bytes, when stored
+ROW_WIDTH = sum(np.dtype(dtype).itemsize for dtype in store.SCHEMA.values())
+
+
+def received(rows):
+  """Estimate the number of bytes received for the rows from the row count and the
+  width of the store columns, rather than visiting each of the values."""
+  return len(rows) * ROW_WIDTH
+
+
+class metrics:
+  def __init__(self, directory, name):
+    """Open a new metrics file for the run in the directory, the file name is the
+    name provided along with the time the run started."""
+    os.makedirs(directory, exist_ok = True)
+    stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    self.filename = os.path.join(directory, '{}-{}.jsonl'.format(name, stamp))
+    self.lock = threading.Lock()
+    self.started = time.perf_counter()
+    self.replicates, self.merges = [], []
+    self.log = open(self.filename, 'w')
+
+  def close(self):
+    """Write the summary of the run to the file and the console."""
+    summary = self.summary()
+    self.__append(summary)
+    self.log.close()
+
+    print('Run summary ({})'.format(self.filename))
+    print('  Downloaded {replicates} replicates, {rows} rows, {bytes} bytes in {elapsed:.1f}s'.format(**summary))
+    for key, label in [('latency', 'Query latency'), ('write', 'Write time'), ('rate', 'Rows/sec')]:
+      if key in summary:
+        print('  {}: '.format(label) + ', '.join('p{} {:.3f}'.format(p, summary[key]['p{}'.format(p)]) for p in PERCENTILES))
+    if 'merge' in summary:
+      print('  Merged {} replicates, read and append p50 {:.3f}s, p95 {:.3f}s'.format(len(self.merges), summary['merge']['p50'], summary['merge']['p95']))
+
+  def __append(self, entry):
+    with self.lock:
+      self.log.write(json.dumps(entry) + '\n')
+      self.log.flush()
+
+  def __percentiles(self, values):
+    # Linear interpolation between the closest ranks, as numpy.percentile does
+    values = sorted(values)
+    result = {}
+    for p in PERCENTILES:
+      rank = (len(values) - 1) * p / 100
+      low = int(rank)
+      high = min(low + 1, len(values) - 1)
+      result['p{}'.format(p)] = values[low] + (values[high] - values[low]) * (rank - low)
+    return result
+
+
+  def replicate(self, replicate, latency, rows, bytes, write):
+    """Record a replicate that was downloaded.
+
+    latency - Seconds between requesting the replicate and receiving all of its rows
+    rows, bytes - The number of rows and the estimated bytes received
+    write - Seconds spent storing the replicate"""
+    entry = {
+      'event'     : 'replicate',
+      'replicate' : int(replicate),
+      'latency'   : latency,
+      'rows'      : rows,
+      'bytes'     : bytes,
+      'write'     : write,
+      'rate'      : rows / latency if latency > 0 else 0
+    }
+    with self.lock:
+      self.replicates.append(entry)
+    self.__append(entry)
+
+  def merge(self, dataset, replicate, read, rows):
+    """Record a replicate that was read and appended to a dataset."""
+    entry = {
+      'event'     : 'merge',
+      'dataset'   : dataset,
+      'replicate' : int(replicate),
+      'read'      : read,
+      'rows'      : rows
+    }
+    with self.lock:
+      self.merges.append(entry)
+    self.__append(entry)
+
+  def summary(self):
+    """Return the summary of the run so far."""
+    with self.lock:
+      replicates, merges = list(self.replicates), list(self.merges)
+    result = {
+      'event'       : 'summary',
+      'elapsed'     : time.perf_counter() - self.started,
+      'replicates'  : len(replicates),
+      'rows'        : sum(entry['rows'] for entry in replicates),
+      'bytes'       : sum(entry['bytes'] for entry in replicates)
+    }
+    if len(replicates) != 0:
+      for key in ['latency', 'write', 'rate']:
+        result[key] = self.__percentiles([entry[key] for entry in replicates])
+    if len(merges) != 0:
+      result['merge'] = self.__percentiles([entry['read'] for entry in merges])
+    return result
@@ -0,0 +1,84 @@
+# reference.py
+#
+# Include file that loads the reference data, the district and MIS region labels
+# along with the observed mutation frequencies, once per process. The data is
+# indexed so that the plots can look up ids, panel positions, and observations
+# without filtering data frames.
+#
+# NOTE that this file is also used by the Plotting scripts, so the paths are
+# NOTE relative to the directory of the script as they are in common.py
+import datetime
+import functools
+import numpy as np
+import pandas as pd
+
+# Paths for the reference data
+DISTRICTS_MAPPING = '../GIS/administrative/uga_districts.csv'
+MIS_MAPPING = '../GIS/administrative/uga_mis_mapping.csv'
+MUTATIONS_TEMPLATE = '../GIS/mutations/uga_{}_mutations.csv'
+
+# The observations used for each mutation, the total resistance uses the 675V
+# observations since they cover more districts
+OBSERVED = { '469Y' : '469Y', '675V' : '675V', 'either' : '675V' }
+
+# The surveys are plotted at the end of September of the year they were conducted
+SURVEY_MONTH, SURVEY_DAY = 9, 30
+
+
+class labels:
+  """Two-way mapping between the ids and labels of a mapping file."""
+
+  def __init__(self, filename):
+    data = pd.read_csv(filename, encoding = 'utf-8-sig')
+    self.id = dict(zip(data.Label, data.ID.astype(int)))
+    self.label = dict(zip(data.ID.astype(int), data.Label))
+
+
+class observations:
+  """The observed frequencies of a mutation, as arrays with one entry per survey,
+  along with the index of the surveys in each district and MIS region. Only some
+  of the files note the MIS region, when it is missing the region is None."""
+
+  def __init__(self, filename, districts):
+    data = pd.read_csv(filename, encoding = 'utf-8-sig')
+    self.district = data.District.to_numpy()
+    self.region = data.MisRegion.to_numpy() if 'MisRegion' in data.columns else np.full(len(data), None)
+    self.year = data.Year.to_numpy()
+    self.frequency = data.Frequency.to_numpy(dtype = float)
+    self.date = np.array([datetime.datetime(int(year), SURVEY_MONTH, SURVEY_DAY) for year in self.year])
+
+    # The districts in the order they first appear are the order of the panels
+    self.districts = data.District.unique().tolist()
+    self.ids = [districts.id[district] for district in self.districts]
+    self.panel = { district : ndx for ndx, district in enumerate(self.districts) }
+    self.panels = { id : ndx for ndx, id in enumerate(self.ids) }
+
+    # Index of the surveys in each district and region
+    self.__districts = { district : np.flatnonzero(self.district == district) for district in self.districts }
+    self.__regions = { region : np.flatnonzero(self.region == region) for region in set(self.region) if region is not None }
+
+  def points(self, district):
+    """Return the index of the surveys in the district."""
+    return self.__districts.get(district, np.empty(0, dtype = int))
+
+  def region_points(self, region):
+    """Return the index of the surveys in the MIS region."""
+    return self.__regions.get(region, np.empty(0, dtype = int))
+
+
+@functools.lru_cache(maxsize = None)
+def districts():
+  """Return the labels of the districts."""
+  return labels(DISTRICTS_MAPPING)
+
+
+@functools.lru_cache(maxsize = None)
+def regions():
+  """Return the labels of the MIS regions."""
+  return labels(MIS_MAPPING)
+
+
+@functools.lru_cache(maxsize = None)
+def mutations(mutation):
+  """Return the observations for the mutation, one of the OBSERVED keys."""
+  return observations(MUTATIONS_TEMPLATE.format(OBSERVED[mutation]), districts())
@@ -4,41 +4,40 @@
 import datetime
 import matplotlib
 import matplotlib.pyplot as plt
-import pandas as pd
+import numpy as np
 
 import include.common as shared
+import include.cube as cube
+import include.reference as reference
+import include.spike.configurations as configurations
+import include.store as store
 
 # This class warps the functions related to plotting calibration studies.
 class calibration:
-  def __plot(self, replicate, title, labels, mutations):
-    DATES, DISTRICT, INFECTED, WEIGHTED = 2, 3, 4, 8
-
+  def __plot(self, replicate, title, labels, observed):
     def label(region):
-      # Filter mutations to the current region, exit if there are none
-      filtered = mutations[(mutations.MisRegion == region) & (mutations.Frequency != 0)]
-      if len(filtered) == 0: return
+      # Filter the observations to the current region, exit if there are none
+      index = observed.region_points(region)
+      index = index[observed.frequency[index] != 0]
+      if len(index) == 0: return
       
       # Add a labeled point for each year and frequency combination
-      plt.sca(axes[row, col])
-      for index, data_row in filtered.iterrows():
-        x = datetime.datetime(data_row.Year, 9, 30)
-        y = data_row.Frequency
-        plt.scatter(x, y, color = 'black', s = 50)
-        plt.annotate('{} ({:.3f})'.format(data_row.District, y), (x, y), textcoords = 'offset points', xytext=(0,10), ha='center', fontsize=18)
+      axes[row, col].scatter(observed.date[index], observed.frequency[index], color = 'black', s = 50)
+      for x, y, district in zip(observed.date[index], observed.frequency[index], observed.district[index]):
+        axes[row, col].annotate('{} ({:.3f})'.format(district, y), (x, y), textcoords = 'offset points', xytext=(0,10), ha='center', fontsize=18)
     
     # Load the spiking data, skip plotting if there is nothing to plot
-    data = pd.read_csv('data/spiking/{}.csv'.format(replicate), header = None)
-    data['frequency'] = data[WEIGHTED] / data[INFECTED]
-    if max(data.frequency) == 0: return
+    data = cube.memory(store.filename(shared.SPIKING_DIRECTORY, replicate))
+    frequency = data.frequency('469Y')[0]
+    if np.nanmax(frequency) == 0: return
     
     # Finish setting up our data for plotting
     # WARNING The start date is hard coded, this might need to change if re-calibration takes place
-    districts = data[DISTRICT].unique().tolist()
-    dates = data[DATES].unique().tolist()
-    dates = [datetime.datetime(2009, 1, 1) + datetime.timedelta(days=x) for x in dates]  
+    districts = data.districts.tolist()
+    dates = [datetime.datetime(2009, 1, 1) + datetime.timedelta(days=int(x)) for x in data.dates]
 
     # Determine our limits
-    ylim = [0, max(max(data.frequency), max(mutations.Frequency))]
+    ylim = [0, max(np.nanmax(frequency), max(observed.frequency))]
     xlim = [min(dates), max(dates)]
       
     # Setup to generate the plot
@@ -49,9 +48,9 @@ class calibration:
     # Generate a 15 panel plot 
     row, col = 0, 0
     for district in districts:
-      axes[row, col].plot(dates, data[data[DISTRICT] == district].frequency)
-      label(labels[labels.ID == district].Label.values[0])
-      axes[row, col].title.set_text(labels[labels.ID == district].Label.values[0])
+      axes[row, col].plot(dates, frequency[:, data.district(district)])
+      label(labels.label[int(district)])
+      axes[row, col].title.set_text(labels.label[int(district)])
       
       if row != 2:    
         plt.setp(axes[row, col].get_xticklabels(), visible = False)
@@ -75,29 +74,24 @@ class calibration:
     plt.savefig('plots/{}.png'.format(title))
     plt.close()
 
-  def process(self):
-    REPLICATE, STUDYID, FILENAME = 3, 1, 2
+  def plot(self, item):
+    """Plot the calibration configuration, which has a single replicate."""
+    # The title is the region and the settings of the calibration filename
+    title = ' - '.join([item.district.capitalize()] + item.settings[:2])
+    self.__plot(item.replicates[0], title, reference.regions(), reference.mutations('469Y'))
 
-    # Load relevant data    
-    data = pd.read_csv(shared.REPLICATES_LIST, header = None)
-    labels = pd.read_csv(shared.MIS_MAPPING)
-    mutations = pd.read_csv(shared.MUTATIONS_469Y)
+  def process(self, items = None):
+    # Load relevant data, only the calibration configurations are plotted
+    if items is None: items = configurations.load()
+    data = [item for item in items if item.is_calibration()]
     
     shared.progressBar(0, len(data))
-    for index, row in data.iterrows():
+    for index, item in enumerate(data):
       try:
-        # Check to see if this is a calibration configuration
-        if row[STUDYID] != 4: continue
-        if len(data[data[FILENAME] == row[FILENAME]]) > 1: continue
-        
-        # Parse out the title components of a calibration filename
-        parts = row[FILENAME].split('-')
-        title = '{} - {} - {}'.format(parts[2].capitalize(), parts[3], parts[4].replace('.yml', ''))
-
         # Generate the plot and update the progress bar
-        self.__plot(row[REPLICATE], title, labels, mutations)
+        self.plot(item)
         shared.progressBar(index, len(data))
       except Exception as ex:
-        print('\nError plotting replicate {}, configuration {}'.format(row[REPLICATE], row[FILENAME]))
+        print('\nError plotting replicate {}, configuration {}'.format(item.replicates[0], item.filename))
         print(ex)
     shared.progressBar(len(data), len(data))    
\ No newline at end of file
@@ -0,0 +1,173 @@
+# configurations.py
+#
+# Include file for the spiking.py script that indexes the replicates list by
+# configuration, so the plotting classes can iterate over the configurations
+# directly rather than filtering the list for every replicate. The parsed
+# configurations are also kept as a typed catalog on disk so that sweeps can be
+# sliced by their parameters without reprocessing the whole study.
+import datetime
+import numpy as np
+import os
+import pandas as pd
+
+import include.common as shared
+
+# The columns of the replicates list, as written by the loader
+CONFIGURATION, STUDYID, FILENAME, REPLICATE = 0, 1, 2, 3
+
+# The study that the calibration configurations belong to
+CALIBRATION_STUDY = 4
+
+# The assumed model year when the year is not part of the file name
+MODEL_YEAR = 2004
+
+# The columns of the catalog, unknown years are zero and unknown fractions are NaN
+CATALOG_DTYPE = [
+  ('configurationid', np.int64), ('study', np.int64), ('district', 'U64'), ('year', np.int64),
+  ('spike', np.float64), ('population', np.float64), ('version', 'U16'), ('replicates', np.int64),
+  ('calibration', bool), ('spiking', bool)
+]
+
+# The version of the catalog, increment it whenever the parsing changes so that the
+# existing catalogs are rebuilt
+CATALOG_VERSION = 2
+
+# Comparisons that can be used when selecting from the catalog
+OPERATORS = {
+  '>=' : np.greater_equal, '<=' : np.less_equal, '>' : np.greater, '<' : np.less, '!=' : np.not_equal, '=' : np.equal
+}
+
+
+class configuration:
+  """A configuration along with its replicates and the parameters parsed from its
+  file name, the parameters are None if the file name is not a recognized layout."""
+
+  def __init__(self, id, study, filename, replicates, count):
+    self.id = id
+    self.study = study
+    self.filename = filename
+    self.replicates = replicates
+
+    # The number of rows in the replicates list that share the file name, a file
+    # name with a single row is a calibration, otherwise it is a spike study
+    self.count = count
+
+    # The file names are uga-<type>-<district>-..., so the district is the third part
+    self.parts = filename.replace('.yml', '').split('-')
+    self.district = self.parts[2] if len(self.parts) > 2 else None
+
+    # The remaining parts are the settings, which the calibration names note as-is
+    self.settings = self.parts[3:]
+    self.year, self.spike, self.population, self.version = parse(self.parts)
+
+  def is_calibration(self):
+    """True if this is a configuration of the calibration study."""
+    return self.study == CALIBRATION_STUDY and self.count == 1
+
+  def is_spike(self):
+    """True if this is a configuration of a spike study."""
+    return self.count > 1
+
+  def start(self):
+    """Return the date that day zero of the replicates corresponds to, which is the
+    start of the year in the file name, or of MODEL_YEAR if it is not recognized."""
+    return datetime.datetime(self.year if self.year is not None else MODEL_YEAR, 1, 1)
+
+
+def parse(parts):
+  """Return the year, spike, population, and version of a spike study file name
+  split on '-', or all None if it is not a recognized layout. Initially studies
+  started in 2009, but as calibration progressed the year was added to the name."""
+  version = None
+  if len(parts) == 4:
+    try:
+      return 2009, 0.075, float(parts[3]), version
+    except ValueError:
+      return None, None, None, None
+  if len(parts) == 6:
+    try:
+      # The version follows a 'v', which may be separated from the population, e.g.,
+      # 0.5v2 or 0.5_v2
+      population, separator, version = parts[5].partition('v')
+      if separator and not version: raise ValueError()
+      return int(parts[3]), float(parts[4]), float(population.rstrip('_.')), version or None
+    except ValueError:
+      pass
+  return None, None, None, None
+
+
+def load(filename = shared.REPLICATES_LIST):
+  """Return the configurations in the replicates list, in the order they first appear."""
+  data = pd.read_csv(filename, header = None)
+  counts = data.groupby(FILENAME, sort = False).size()
+  configurations = []
+  for id, rows in data.groupby(CONFIGURATION, sort = False):
+    first = rows.iloc[0]
+    configurations.append(configuration(id, first[STUDYID], first[FILENAME], rows[REPLICATE].tolist(), int(counts[first[FILENAME]])))
+  return configurations
+
+
+class catalog:
+  """Typed table of the configurations in the replicates list, with one row per
+  configuration. The table is written next to the replicates list and is only
+  rebuilt when the list changes."""
+
+  def __init__(self, filename = shared.REPLICATES_LIST, path = shared.CATALOG_FILE):
+    self.filename = filename
+    self.__configurations = None
+    stat = os.stat(filename)
+    source = np.array([stat.st_size, stat.st_mtime_ns, CATALOG_VERSION])
+    try:
+      with np.load(path) as cached:
+        if np.array_equal(cached['source'], source):
+          self.table = cached['table']
+          return
+    except (IOError, KeyError, ValueError):
+      pass
+
+    # Build the table and write it atomically
+    self.table = np.array([(item.id, item.study, item.district or '', item.year or 0,
+      np.nan if item.spike is None else item.spike, np.nan if item.population is None else item.population,
+      item.version or '', len(item.replicates), item.is_calibration(), item.is_spike()) for item in self.configurations()],
+      dtype = CATALOG_DTYPE)
+    temporary = path + '.tmp.npz'
+    np.savez(temporary, table = self.table, source = source)
+    os.replace(temporary, path)
+
+  def configurations(self):
+    """Return the configurations in the replicates list."""
+    if self.__configurations is None: self.__configurations = load(self.filename)
+    return self.__configurations
+
+  def select(self, criteria):
+    """Return the rows of the table that match all of the criteria, a list of
+    (column, operator, value) tuples with an operator from OPERATORS, e.g.,
+    [('district', '=', 'lamwo'), ('spike', '>=', 0.05)]. Text is compared
+    without regard to case."""
+    mask = np.ones(len(self.table), dtype = bool)
+    for column, operator, value in criteria:
+      values = self.table[column]
+      if values.dtype.kind == 'U':
+        values, value = np.char.lower(values), str(value).lower()
+      elif values.dtype.kind == 'b':
+        value = str(value).lower() in ['1', 'true', 'yes']
+      else:
+        value = np.array(value).astype(values.dtype)
+      mask &= OPERATORS[operator](values, value)
+    return self.table[mask]
+
+  def items(self, criteria):
+    """Return the configurations that match all of the criteria."""
+    ids = set(self.select(criteria)['configurationid'].tolist())
+    return [item for item in self.configurations() if item.id in ids]
+
+
+def criterion(text):
+  """Parse a criterion of the form <column><operator><value>, e.g., spike>=0.05."""
+  for operator in OPERATORS:
+    if operator in text:
+      column, value = [part.strip() for part in text.split(operator, 1)]
+      if column not in [name for name, _ in CATALOG_DTYPE]:
+        raise ValueError('Unknown catalog column: {}'.format(column))
+      return column, operator, value
+  raise ValueError('No comparison in criterion: {}'.format(text))
@@ -4,9 +4,13 @@
 import datetime
 import matplotlib
 import matplotlib.pyplot as plt
-import pandas as pd
+import numpy as np
 
 import include.common as shared
+import include.cube as cube
+import include.reference as reference
+import include.spike.configurations as configurations
+import include.store as store
 
 # This class wraps the functions related to plotting dual spike studies and 
 # the spike calibration / validation studies.
@@ -14,26 +18,31 @@ class dual_spike:
   # Note the assumed model year
   MODEL_YEAR = 2004
 
-  mutations = None
-  labels = None
+  # The mutations plotted for each configuration
+  MUTATIONS = ['469Y', '675V', 'either']
   
-  def __plot(self, replicates, mutation, ylabel, title, footer, filename):
-    DATES, DISTRICT, INFECTIONS = 2, 3, 4
-    MAPPING = { '469Y' : 8, '675V' : 11, 'either' : 14 }
+  def __load(self, replicates, ids):
+    # Load each of the replicates once, returning the dates, the (replicate, mutation,
+    # date, district) frequencies for the district ids, and the (replicate, mutation)
+    # peak frequency in any district
+    frequencies, peaks = [], []
+    for replicate in replicates:
+      data = cube.memory(store.filename(shared.SPIKING_DIRECTORY, replicate))
+      columns = [data.district(id) for id in ids]
+      values = [data.frequency(mutation, 0) for mutation in self.MUTATIONS]
+      frequencies.append(np.stack([value[:, columns] for value in values]))
+      peaks.append([np.nanmax(value) for value in values])
+    dates = [datetime.datetime(self.MODEL_YEAR, 1, 1) + datetime.timedelta(days=int(x)) for x in data.dates]
+    return dates, np.stack(frequencies), np.array(peaks)
 
+  def __plot(self, dates, frequencies, peak, mutation, observed, ylabel, title, footer, filename):
     def add_points():
       row, col = 0, 0
       for district in districts:
-        plt.sca(axes[row, col])
-        for index, data_row in self.mutations[self.mutations.District == district].iterrows():
-          x = datetime.datetime(data_row.Year, 9, 30)
-          y = data_row.Frequency
-          plt.scatter(x, y, color = 'black', s = 100, zorder = 99)
+        index = observed.points(district)
+        axes[row, col].scatter(observed.date[index], observed.frequency[index], color = 'black', s = 100, zorder = 99)
         row, col = shared.increment(row, col)
 
-    # Note the correct index of the weighted values
-    weighted = MAPPING[mutation]
-  
     # Setup to generate the plot
     matplotlib.rc_file('../Scripts/matplotlibrc-line')
     figure, axes = plt.subplots(3, 5)
@@ -41,23 +50,16 @@ class dual_spike:
     figure.text(0.5 - (len(footer) / 400), 0.04, footer, size='small')
     
     # Set a single order for the districts
-    districts = self.mutations.District.unique()
-  
-    # Start by preparing the replicate data that we need to plot
-    ymax = max(self.mutations.Frequency)
-    for replicate in replicates:
-      # Load the data and prepare the dates
-      data = pd.read_csv('data/spiking/{}.csv'.format(replicate), header = None)
-      data['frequency'] = data[weighted] / data[INFECTIONS]
-      ymax = max(ymax, max(data.frequency))
-      dates = data[DATES].unique().tolist()
-      dates = [datetime.datetime(self.MODEL_YEAR, 1, 1) + datetime.timedelta(days=x) for x in dates]
+    districts = observed.districts
   
+    # Start by preparing the replicate data that we need to plot, the frequencies are
+    # the (replicate, date, district) values for the districts of the observations
+    ymax = max(max(observed.frequency), peak)
+    for frequency in frequencies:
       # Generate a 15 panel plot while looping over the districts that we have spiking data for
       row, col = 0, 0
-      for district in districts:
-        district_id = self.labels[self.labels.Label == district].ID.values[0]
-        axes[row, col].plot(dates, data[data[DISTRICT] == district_id].frequency)
+      for ndx, district in enumerate(districts):
+        axes[row, col].plot(dates, frequency[:, ndx])
         axes[row, col].title.set_text(district)
         row, col = shared.increment(row, col)
           
@@ -88,47 +90,39 @@ class dual_spike:
     plt.savefig('plots/{}'.format(filename))
     plt.close()
   
-  def __process(self, mutation):
-    CONFIGURATION, REPLICATE, FILENAME = 0, 3, 2
+  def plot(self, item):
+    """Plot all of the mutations for the spike study configuration."""
+    observed = [reference.mutations(mutation) for mutation in self.MUTATIONS]
+
+    # The districts of all of the observations, so each replicate is only loaded once
+    ids = sorted(set(id for entry in observed for id in entry.ids))
+    dates, frequencies, peaks = self.__load(item.replicates, ids)
+    for ndx, mutation in enumerate(self.MUTATIONS):
+      # Set the title and filename for the results
+      title = 'Spike Calibration, {}'.format(mutation)
+      ylabel = '{} Frequency'.format(mutation)
+      if mutation == 'either':
+        title = 'Total ART Resistance'
+        ylabel = 'Total ART Resistance Frequency'
+      footer = '{}, n = {}'.format(item.filename, len(item.replicates))
+      filename = 'uga-spike-{}-{}.png'.format(item.id, mutation)
 
-    # Load relevant data
-    data = pd.read_csv(shared.REPLICATES_LIST, header = None)
-    self.labels = pd.read_csv(shared.DISTRICTS_MAPPING)
-    if mutation == 'either':
-      self.mutations = pd.read_csv(shared.MUTATIONS_TEMPLATE.format('675V'))
-    else:  
-      self.mutations = pd.read_csv(shared.MUTATIONS_TEMPLATE.format(mutation))
+      # Prepare the plot from the columns of the districts for the mutation
+      columns = [ids.index(id) for id in observed[ndx].ids]
+      self.__plot(dates, frequencies[:, ndx][:, :, columns], np.nanmax(peaks[:, ndx]), mutation, observed[ndx],
+        ylabel, title, footer, filename)
+
+  def process(self, items = None):
+    # Load relevant data, only the spike studies are plotted
+    if items is None: items = configurations.load()
+    data = [item for item in items if item.is_spike()]
   
-    configurations = []
     shared.progressBar(0, len(data))
-    for index, row in data.iterrows():
+    for index, item in enumerate(data):
       try:
-        # Check to see if we can skip this entry
-        if len(data[data[FILENAME] == row[FILENAME]]) == 1: continue
-        if row[CONFIGURATION] in configurations: continue
-
-        # Get the list of replicates associated with this configuration
-        replicates = data[data[CONFIGURATION] == row[CONFIGURATION]][REPLICATE]
-
-        # Set the title and filename for the results
-        title = 'Spike Calibration, {}'.format(mutation)
-        ylabel = '{} Frequency'.format(mutation)
-        if mutation == 'either':
-          title = 'Total ART Resistance'
-          ylabel = 'Total ART Resistance Frequency'
-        footer = '{}, n = {}'.format(row[FILENAME], len(replicates))
-        filename = 'uga-spike-{}-{}.png'.format(row[CONFIGURATION], mutation)
-
-        # Prepare the plot, note the configuration
-        self.__plot(replicates, mutation, ylabel, title, footer, filename)
-        configurations.append(row[CONFIGURATION])
+        self.plot(item)
         shared.progressBar(index, len(data))
       except Exception as ex:
-          print('\nError plotting replicate {}, configuration {}'.format(row[REPLICATE], row[FILENAME]))
+          print('\nError plotting configuration {}, {}'.format(item.id, item.filename))
           print(ex)
-    shared.progressBar(len(data), len(data))    
-
-  def process(self):
-    self.__process('469Y')
-    self.__process('675V')
-    self.__process('either')
\ No newline at end of file
+    shared.progressBar(len(data), len(data))
\ No newline at end of file
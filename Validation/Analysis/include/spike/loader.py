@@ -4,10 +4,16 @@
 #
 # NOTE that this was upgraded from only returning a single mutant in the uga_calibration
 # NOTE database. So we assume that we are pointing at the correct database when running.
-import csv
+import functools
 import os
 
 import include.common as shared
+import include.cube as cube
+import include.store as store
+from include.download import download, query
+from include.genotypes import queries
+from include.manifest import manifest
+from include.metrics import metrics
 
 # This class wraps the functions related to loading replicate data.
 class loader:
@@ -28,97 +34,64 @@ class loader:
     """
     return shared.select(shared.CONNECTION, sql, None)
 
-  # Get the spiking replicate data from the database
-  def __get_replicate_single(self, replicateId):
-    sql = """
-        SELECT *, 
-          (weightedoccurrences_469y + weightedoccurrences_675v) as weightedsum,
-          (occurrences_469Y + occurrences_675v) as occurrences_sum
-        FROM (
-          SELECT c.id as configurationid, sd.replicateid, sd.dayselapsed,
-            sd.district, infectedindividuals,  clinicalepisodes, 
-            CASE WHEN y_mutant.occurrences IS NULL THEN 0 else y_mutant.occurrences END AS occurrences_469y,
-            CASE WHEN y_mutant.clinicaloccurrences IS NULL THEN 0 else y_mutant.clinicaloccurrences END AS clinicaloccurrences_469y,
-            CASE WHEN y_mutant.weightedoccurrences IS NULL THEN 0 else y_mutant.weightedoccurrences END AS weightedoccurrences_469y,
-            CASE WHEN v_mutant.occurrences IS NULL THEN 0 else v_mutant.occurrences END AS occurrences_675v,
-            CASE WHEN v_mutant.clinicaloccurrences IS NULL THEN 0 else v_mutant.clinicaloccurrences END AS clinicaloccurrences_675v,
-            CASE WHEN v_mutant.weightedoccurrences IS NULL THEN 0 else v_mutant.weightedoccurrences END AS weightedoccurrences_675v,		  
-            treatments,
-            treatmentfailures
-          FROM (
-            SELECT md.replicateid, md.dayselapsed, msd.location AS district,
-              sum(msd.infectedindividuals) AS infectedindividuals, 
-              sum(msd.clinicalepisodes) AS clinicalepisodes,
-              sum(msd.treatments) AS treatments,
-              sum(msd.treatmentfailures) as treatmentfailures
-            FROM sim.monthlydata md
-              INNER JOIN sim.monthlysitedata msd on msd.monthlydataid = md.id
-            WHERE md.replicateid = %(replicateId)s
-              AND md.dayselapsed > (7 * 365)
-            GROUP BY md.replicateid, md.dayselapsed, msd.location) sd
-          LEFT JOIN (
-            SELECT md.replicateid, md.dayselapsed, mgd.location AS district,
-            sum(mgd.occurrences) AS occurrences,
-              sum(mgd.clinicaloccurrences) AS clinicaloccurrences,
-              sum(mgd.weightedoccurrences) AS weightedoccurrences
-            FROM sim.monthlydata md
-              INNER JOIN sim.monthlygenomedata mgd on mgd.monthlydataid = md.id
-              INNER JOIN sim.genotype g on g.id = mgd.genomeid
-            WHERE md.replicateid = %(replicateId)s
-              AND md.dayselapsed > (7 * 365)
-              AND g.name ~ '^.....Y..'
-            GROUP BY md.replicateid, md.dayselapsed, mgd.location) y_mutant ON (y_mutant.replicateid = sd.replicateid 
-              AND y_mutant.dayselapsed = sd.dayselapsed
-              AND y_mutant.district = sd.district)
-          LEFT JOIN (
-            SELECT md.replicateid, md.dayselapsed, mgd.location AS district,
-            sum(mgd.occurrences) AS occurrences,
-              sum(mgd.clinicaloccurrences) AS clinicaloccurrences,
-              sum(mgd.weightedoccurrences) AS weightedoccurrences
-            FROM sim.monthlydata md
-              INNER JOIN sim.monthlygenomedata mgd on mgd.monthlydataid = md.id
-              INNER JOIN sim.genotype g on g.id = mgd.genomeid
-            WHERE md.replicateid = %(replicateId)s
-              AND md.dayselapsed > (7 * 365)
-              AND g.name ~ '^......V.'
-            GROUP BY md.replicateid, md.dayselapsed, mgd.location) v_mutant ON (v_mutant.replicateid = sd.replicateid 
-              AND v_mutant.dayselapsed = sd.dayselapsed
-              AND v_mutant.district = sd.district)			
-            INNER JOIN sim.replicate r on r.id = sd.replicateid
-            INNER JOIN sim.configuration c on c.id = r.configurationid
-          WHERE r.endtime is not null
-            AND r.id = %(replicateId)s) iq
-        ORDER BY replicateid, dayselapsed"""
-    return shared.select(shared.CONNECTION, sql, {'replicateId':replicateId})  
+  # Get the spiking replicate data from the database, the callback is invoked with the 
+  # rows for each of the replicates
+  def __get_replicate_single(self, connection, replicateIds, callback, summary = False):
+    for template, parameters, ids in queries(connection, replicateIds, summary):
+      sql = template.format(filter='= %(replicateId)s')
+      for replicateId in ids:
+        parameters['replicateId'] = replicateId
+        callback(replicateId, query(connection, sql, parameters))
 
-  # Process the replicates to make sure we have all of the data we need locally
-  def load(self):
-    def save_csv(filename, data):
-      with open(filename, 'w') as csvfile:
-        writer = csv.writer(csvfile)
-        for row in data:
-          writer.writerow(row)
+  # Process the replicates to make sure we have all of the data we need locally,
+  # jobs is the number of replicates to download concurrently, verify is True if
+  # the checksum of every replicate should be checked, summary is True if the
+  # replicates should be read from the sim.districtsummary table where possible,
+  # ready is called with the id of each replicate once it is available locally,
+  # which may be from one of the download threads
+  def load(self, jobs = 1, verify = False, summary = False, ready = None):
+    def save(id, rows):
+      filename = store.filename(shared.SPIKING_DIRECTORY, id)
+      store.write(filename, rows)
+      ledger.record(id, filename, len(rows), endtimes[id])
+      if ready is not None: ready(id)
 
     print("Querying for replicates list...")
     if not os.path.exists(shared.SPIKING_DIRECTORY): os.makedirs(shared.SPIKING_DIRECTORY)
     replicates = self.__get_replicates()
-    save_csv(shared.REPLICATES_LIST, replicates)
+    shared.save_csv(shared.REPLICATES_LIST, replicates)
     
     print("Processing replicates...")  
-    count = 0
-    shared.progressBar(count, len(replicates))
+    ledger = manifest(shared.REPLICATES_MANIFEST, verify)
+    telemetry = metrics(shared.METRICS_DIRECTORY, 'spiking')
+    pending, endtimes = [], {}
     for row in replicates:
-      # Check to see if we already have the data
-      filename = os.path.join(shared.SPIKING_DIRECTORY, "{}.csv".format(row[3]))
-      if os.path.exists(filename): continue
+      # Check to see if we already have the data, converting previously downloaded CSV files
+      endtimes[row[3]] = row[5]
+      filename = store.filename(shared.SPIKING_DIRECTORY, row[3])
+      legacy = os.path.join(shared.SPIKING_DIRECTORY, "{}.csv".format(row[3]))
+      if not os.path.exists(filename) and os.path.exists(legacy):
+        try:
+          store.convert(legacy, filename)
+        except ValueError as ex:
+          # The replicate is downloaded again since there is no store file
+          print("Unable to convert replicate {}, {}".format(row[3], ex))
+      if not ledger.valid(row[3], filename, row[5]):
+        pending.append([row[3]])
+      elif ready is not None:
+        ready(row[3])
 
-      # Query and store the data
-      replicate = self.__get_replicate_single(row[3])
-      save_csv(filename, replicate)
-
-      # Update the progress bar
-      count = count + 1
-      shared.progressBar(count, len(replicates))
+    # Query and store the data
+    fetch = functools.partial(self.__get_replicate_single, summary = summary)
+    count = download(pending, fetch, save, jobs, len(replicates), len(replicates) - len(pending), telemetry)
+    ledger.close()
 
     # Complete progress bar for replicates
-    if count != len(replicates): shared.progressBar(len(replicates), len(replicates))
\ No newline at end of file
+    if count != len(replicates): shared.progressBar(len(replicates), len(replicates))
+
+    # Report the throughput of the run
+    telemetry.close()
+
+    # The replicates are arranged in memory when plotted, so remove the cubes
+    # written next to them by earlier versions
+    cube.clean(shared.SPIKING_DIRECTORY)
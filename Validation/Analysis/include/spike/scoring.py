@@ -0,0 +1,95 @@
+# scoring.py
+#
+# Include file for the spiking.py script that defines the scoring class, which
+# ranks the spike configurations by how well they reproduce the observed mutation
+# frequencies without rendering any plots.
+import numpy as np
+import warnings
+
+import include.common as shared
+import include.cube as cube
+import include.reference as reference
+import include.spike.configurations as configurations
+import include.store as store
+
+# This class wraps the functions related to scoring spike studies against the observations.
+class scoring:
+  # The mutations with observations to score against
+  MUTATIONS = ['469Y', '675V']
+
+  # The number of configurations to report on the console
+  TOP = 10
+
+  def __init__(self):
+    # The observations, and the district id of each of them
+    self.observed = [reference.mutations(mutation) for mutation in self.MUTATIONS]
+    self.ids = [[reference.districts().id[district] for district in observed.district] for observed in self.observed]
+
+  def __score(self, item):
+    # Days elapsed from the start of the configuration to each observation, this is
+    # the same origin that the plots use for the configuration
+    start = item.start()
+    elapsed = [np.array([(date - start).days for date in observed.date]) for observed in self.observed]
+
+    # Load the (replicate, observation) simulated frequencies for each mutation
+    simulated = [[] for _ in self.MUTATIONS]
+    for replicate in item.replicates:
+      data = cube.memory(store.filename(shared.SPIKING_DIRECTORY, replicate))
+      for ndx, days in enumerate(elapsed):
+        # Find the last date on or before each observation, those outside of the
+        # simulation are NaN and are not scored
+        dates = np.searchsorted(data.dates, days, side='right') - 1
+        inside = (dates >= 0) & (days <= data.dates[-1])
+        columns = np.array([data.district(id) for id in self.ids[ndx]])
+        values = np.full(len(days), np.nan)
+        values[inside] = data.frequency(self.MUTATIONS[ndx], 0)[dates[inside], columns[inside]]
+        simulated[ndx].append(values)
+
+    # Compare the median of the replicates to the observations
+    row = [item.id, item.filename, item.district, len(item.replicates)]
+    errors = []
+    for ndx, observed in enumerate(self.observed):
+      # Observations with no simulated values are expected, so the warning is suppressed
+      with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        error = np.nanmedian(np.array(simulated[ndx]), axis=0) - observed.frequency
+      error = error[~np.isnan(error)]
+      errors.append(error)
+      row += self.__metrics(error)
+    row += self.__metrics(np.concatenate(errors))
+    return row
+
+  def __metrics(self, error):
+    # Return the count, root mean squared error, mean absolute error, and bias
+    if len(error) == 0: return [0, np.nan, np.nan, np.nan]
+    return [len(error), np.sqrt(np.mean(error ** 2)), np.mean(np.abs(error)), np.mean(error)]
+
+  def process(self, items = None):
+    # Score the spike studies, the calibration studies are by MIS region so they
+    # cannot be compared to the district observations
+    if items is None: items = configurations.load()
+    data = [item for item in items if item.is_spike()]
+
+    rows = []
+    shared.progressBar(0, len(data))
+    for index, item in enumerate(data):
+      try:
+        rows.append(self.__score(item))
+        shared.progressBar(index, len(data))
+      except Exception as ex:
+        print('\nError scoring configuration {}, {}'.format(item.id, item.filename))
+        print(ex)
+    shared.progressBar(len(data), len(data))
+
+    # Rank by the root mean squared error over all of the observations
+    RMSE = -3
+    rows.sort(key = lambda row: (np.isnan(row[RMSE]), row[RMSE]))
+    header = ['rank', 'configurationid', 'filename', 'district', 'replicates']
+    for name in self.MUTATIONS + ['all']:
+      header += ['{}_{}'.format(name, metric) for metric in ['n', 'rmse', 'mae', 'bias']]
+    shared.save_csv(shared.SCORES_FILE, [header] + [[rank + 1] + row for rank, row in enumerate(rows)])
+
+    # Note the best configurations
+    print('\nScores saved to {}, best {} configurations:'.format(shared.SCORES_FILE, min(self.TOP, len(rows))))
+    for rank, row in enumerate(rows[:self.TOP]):
+      print('{:>3}. {} (n = {}), RMSE {:.4f}, MAE {:.4f}, bias {:+.4f}'.format(rank + 1, row[1], row[3], row[RMSE], row[RMSE + 1], row[RMSE + 2]))
@@ -0,0 +1,192 @@
+# store.py
+#
+# Include file that defines the columnar on-disk store used for the replicate and
+# dataset files. Each file is an uncompressed NumPy archive (.npz) with one array
+# per column of the replicate query, so readers only load the columns they need.
+#
+# NOTE that this file is also used by the Plotting scripts, so it should only
+# NOTE depend upon NumPy and pandas.
+import numpy as np
+import os
+import pandas as pd
+import shutil
+import tempfile
+import time
+import zipfile
+
+# The file extension used by the store
+EXTENSION = '.npz'
+
+# The columns returned by the replicate query, in order, along with their types
+SCHEMA = {
+  'configurationid'           : np.int32,
+  'replicateid'               : np.int32,
+  'dayselapsed'               : np.int32,
+  'district'                  : np.int32,
+  'infectedindividuals'       : np.int32,
+  'clinicalepisodes'          : np.int32,
+  'occurrences_469y'          : np.int32,
+  'clinicaloccurrences_469y'  : np.int32,
+  'weightedoccurrences_469y'  : np.float64,
+  'occurrences_675v'          : np.int32,
+  'clinicaloccurrences_675v'  : np.int32,
+  'weightedoccurrences_675v'  : np.float64,
+  'treatments'                : np.int32,
+  'treatmentfailures'         : np.int32,
+  'weightedsum'               : np.float64,
+  'occurrences_sum'           : np.int32
+}
+
+
+def filename(path, name):
+  """Return the full path of the store file with the given name in the path."""
+  return os.path.join(path, '{}{}'.format(name, EXTENSION))
+
+
+def column(name, values, dtype):
+  """Convert the values of the named column to the schema type, raises a ValueError
+  if any of them are missing (None or NaN) rather than storing a sentinel."""
+  try:
+    values = np.asarray(values)
+    if values.dtype.kind == 'f' and np.isnan(values).any():
+      raise ValueError()
+    return values.astype(dtype)
+  except (TypeError, ValueError):
+    raise ValueError('Column {} has missing or invalid values'.format(name))
+
+
+def columns(data):
+  """Convert the data to a dictionary of column arrays with the schema types.
+
+  data - A pandas data frame or dictionary with the columns named by the schema,
+         or a list of rows in the order of the schema"""
+  if isinstance(data, (pd.DataFrame, dict)):
+    return { name : column(name, data[name], dtype) for name, dtype in SCHEMA.items() }
+
+  # Transpose the rows to the columns
+  if len(data) == 0:
+    return { name : np.empty(0, dtype = dtype) for name, dtype in SCHEMA.items() }
+  if any(len(row) != len(SCHEMA) for row in data):
+    raise ValueError('Expected {} columns in every row'.format(len(SCHEMA)))
+  values = list(zip(*data))
+  return { name : column(name, values[ndx], dtype) for ndx, (name, dtype) in enumerate(SCHEMA.items()) }
+
+
+def write(filename, data):
+  """Write the data to the store file, see columns() for the formats accepted."""
+  with writer(filename) as out:
+    out.append(data)
+
+
+def arrays(filename, fields = None):
+  """Read the store file and return a dictionary of the column arrays.
+
+  fields - The columns to load, or None to load all of them"""
+  if fields is None: fields = list(SCHEMA.keys())
+  with np.load(filename) as archive:
+    return { field : archive[field] for field in fields }
+
+
+def check(filename):
+  """Check the contents of the store file and return the number of rows, raises a
+  ValueError if it is missing columns, the columns differ in length, there are
+  missing values, or it is empty."""
+  with np.load(filename) as archive:
+    missing = [field for field in SCHEMA if field + '.npy' not in archive.zip.namelist()]
+    if len(missing) != 0:
+      raise ValueError('Missing columns: {}'.format(', '.join(missing)))
+    rows = None
+    for field, dtype in SCHEMA.items():
+      values = archive[field]
+      if values.dtype != np.dtype(dtype) or values.ndim != 1:
+        raise ValueError('Column {} has the wrong type'.format(field))
+      if rows is not None and len(values) != rows:
+        raise ValueError('Column {} has {} rows, expected {}'.format(field, len(values), rows))
+      rows = len(values)
+      missing = np.isnan(values) if values.dtype.kind == 'f' else values == np.iinfo(dtype).min
+      if missing.any():
+        raise ValueError('Column {} has missing values'.format(field))
+  if rows == 0: raise ValueError('No rows')
+  return rows
+
+
+def read(filename, fields = None):
+  """Read the store file and return a pandas data frame.
+
+  fields - The columns to load, or None to load all of them"""
+  return pd.DataFrame(arrays(filename, fields))
+
+
+def convert(csvfile, outfile):
+  """Convert a headerless CSV file in the replicate query layout to the store, raises
+  a ValueError if any of the rows are incomplete."""
+  try:
+    data = pd.read_csv(csvfile, header = None, names = list(SCHEMA.keys()), dtype = SCHEMA, on_bad_lines = 'error')
+  except (TypeError, pd.errors.ParserError) as ex:
+    raise ValueError('Unable to read {}: {}'.format(csvfile, ex))
+  if len(data) == 0: raise ValueError('No rows in {}'.format(csvfile))
+  write(outfile, data)
+
+
+def merge(sources, outfile, appended = None):
+  """Merge the store files into the output file, streaming them so only one is in
+  memory at a time.
+
+  appended - Function (index, seconds, rows) called after each of the sources is
+             appended, or None"""
+  with writer(outfile) as out:
+    for index, source in enumerate(sources):
+      started = time.perf_counter()
+      data = arrays(source)
+      out.append(data)
+      if appended is not None: appended(index, time.perf_counter() - started, len(data['replicateid']))
+
+
+class writer:
+  """Incrementally write a store file. Each column is streamed to a temporary file
+  as it is appended, so only the block being appended is held in memory, and the
+  archive is assembled when the writer is closed."""
+
+  def __init__(self, filename):
+    self.filename = filename
+    self.rows = 0
+    self.directory = tempfile.TemporaryDirectory(dir = os.path.dirname(os.path.abspath(filename)))
+    self.files = { column : open(os.path.join(self.directory.name, column), 'wb') for column in SCHEMA }
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, type, value, traceback):
+    if type is None:
+      self.close()
+    else:
+      self.__cleanup()
+
+  def append(self, data):
+    """Append the rows to the file, see columns() for the formats accepted."""
+    data = columns(data)
+    for column, values in data.items():
+      values.tofile(self.files[column])
+    self.rows += len(data['replicateid'])
+
+  def close(self):
+    """Assemble the columns into the store file, the file is written under a 
+    temporary name and then renamed so that it is never left partially written."""
+    temporary = self.filename + '.tmp'
+    try:
+      with zipfile.ZipFile(temporary, 'w', zipfile.ZIP_STORED, allowZip64 = True) as archive:
+        for column, dtype in SCHEMA.items():
+          self.files[column].close()
+          header = {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False, 'shape': (self.rows,)}
+          with archive.open(column + '.npy', 'w', force_zip64 = True) as member:
+            np.lib.format.write_array_header_1_0(member, header)
+            with open(os.path.join(self.directory.name, column), 'rb') as values:
+              shutil.copyfileobj(values, member)
+      os.replace(temporary, self.filename)
+    finally:
+      if os.path.exists(temporary): os.remove(temporary)
+      self.__cleanup()
+
+  def __cleanup(self):
+    for file in self.files.values(): file.close()
+    self.directory.cleanup()
@@ -0,0 +1,150 @@
+#!/usr/bin/python3
+
+# ingest.py
+#
+# Ingest the SQLite databases written by the SQLiteDistrictReporter (one per job,
+# e.g., monthly_data_0.db) and aggregate them in the same way that the loader does
+# when querying the database. This allows replicates that were run on the HPC to
+# be analyzed locally without needing a database server.
+import argparse
+import multiprocessing
+import os
+import re
+import sqlite3
+import sys
+
+import include.store as store
+from include.genotypes import classify
+from include.manifest import manifest
+
+# From the PSU-CIDD-MaSim-Support repository
+sys.path.insert(1, '../../PSU-CIDD-MaSim-Support/Python/include')
+from utility import progressBar
+
+# Various script constants
+DATASET_DIRECTORY = 'data/datasets'
+INGEST_DIRECTORY = 'data/ingest'
+DATABASE_PATTERN = re.compile(r'^monthly_data_(\d+)\.db$')
+MANIFEST = 'manifest.jsonl'
+
+# Only the data after the burn-in is used, this matches the database query
+START_DAY = 7 * 365
+
+SITE_SQL = """
+    SELECT md.dayselapsed, msd.locationid AS district,
+      coalesce(sum(msd.infectedindividuals), 0) AS infectedindividuals,
+      coalesce(sum(msd.clinicalepisodes), 0) AS clinicalepisodes,
+      coalesce(sum(msd.treatments), 0) AS treatments,
+      coalesce(sum(msd.treatmentfailures), 0) AS treatmentfailures
+    FROM monthlydata md
+      INNER JOIN monthlysitedata msd ON msd.monthlydataid = md.id
+    WHERE md.dayselapsed > ?
+    GROUP BY md.dayselapsed, msd.locationid
+    ORDER BY md.dayselapsed, msd.locationid"""
+
+GENOME_SQL = """
+    SELECT md.dayselapsed, mgd.locationid AS district,
+      sum(a.y469 * mgd.occurrences), sum(a.y469 * mgd.clinicaloccurrences), sum(a.y469 * mgd.weightedoccurrences),
+      sum(a.v675 * mgd.occurrences), sum(a.v675 * mgd.clinicaloccurrences), sum(a.v675 * mgd.weightedoccurrences)
+    FROM monthlydata md
+      INNER JOIN monthlygenomedata mgd ON mgd.monthlydataid = md.id
+      INNER JOIN temp.alleles a ON a.id = mgd.genomeid
+    WHERE md.dayselapsed > ?
+    GROUP BY md.dayselapsed, mgd.locationid"""
+
+
+def get_replicate(filename, configurationId, replicateId):
+    # Open the database read-only, temporary tables are still permitted
+    connection = sqlite3.connect('file:{}?mode=ro'.format(filename), uri=True)
+    try:
+        # Decode the genotypes once so the genome data only needs to be scanned once
+        genotypes = connection.execute('SELECT id, name FROM genotype').fetchall()
+        connection.execute('CREATE TEMP TABLE alleles (id INTEGER PRIMARY KEY, y469 INTEGER, v675 INTEGER)')
+        connection.executemany('INSERT INTO temp.alleles VALUES (?, ?, ?)', [
+            (id,) + tuple(int(flag) for flag in classify(name)) for id, name in genotypes])
+
+        # Aggregate the genome data by month and district
+        genomes = {}
+        for row in connection.execute(GENOME_SQL, (START_DAY,)):
+            genomes[(row[0], row[1])] = row[2:]
+
+        # Join it to the site data, in the same layout as the replicate query
+        rows = []
+        for days, district, infected, clinical, treatments, failures in connection.execute(SITE_SQL, (START_DAY,)):
+            genome = genomes.get((days, district), (0, 0, 0, 0, 0, 0))
+            rows.append((configurationId, replicateId, days, district, infected, clinical) +
+                tuple(genome) + (treatments, failures, genome[2] + genome[5], genome[0] + genome[3]))
+        return rows
+    finally:
+        connection.close()
+
+
+def ingest(parameters):
+    # Worker process, aggregate the database and write it to the store
+    filename, outfile, configurationId, replicateId = parameters
+    rows = get_replicate(filename, configurationId, replicateId)
+    store.write(outfile, rows)
+    return replicateId, len(rows)
+
+
+def main(directory, name, configurationId, jobs):
+    # Find the databases written by each of the jobs
+    databases = {}
+    for file in os.listdir(directory):
+        match = DATABASE_PATTERN.match(file)
+        if match: databases[int(match.group(1))] = os.path.join(directory, file)
+    if len(databases) == 0:
+        sys.stderr.write('No SQLite databases found in {}\n'.format(directory))
+        sys.exit(1)
+
+    # Make the relevant directories
+    replicates = os.path.join(INGEST_DIRECTORY, name)
+    os.makedirs(replicates, exist_ok=True)
+    os.makedirs(DATASET_DIRECTORY, exist_ok=True)
+
+    # Only ingest the databases that are newer than the replicate files, the time
+    # stamp of the database is used as the end time of the replicate in the manifest
+    ledger = manifest(os.path.join(replicates, MANIFEST))
+    pending, endtimes = [], {}
+    for job, filename in databases.items():
+        outfile = store.filename(replicates, job)
+        endtimes[job] = os.stat(filename).st_mtime_ns
+        if os.path.exists(outfile) and os.path.getmtime(outfile) >= os.path.getmtime(filename) \
+            and ledger.valid(job, outfile, endtimes[job]): continue
+        pending.append((filename, outfile, configurationId, job))
+
+    # Ingest the databases in parallel
+    print('Ingesting {} of {} databases...'.format(len(pending), len(databases)))
+    count = len(databases) - len(pending)
+    progressBar(count, len(databases))
+    with multiprocessing.Pool(jobs) as pool:
+        for job, rows in pool.imap_unordered(ingest, pending):
+            ledger.record(job, store.filename(replicates, job), rows, endtimes[job])
+            count += 1
+            progressBar(count, len(databases))
+
+    # Merge the replicates into the dataset when they have changed
+    jobs, dataset = sorted(databases.keys()), store.filename(DATASET_DIRECTORY, name)
+    if ledger.current(name, dataset, jobs):
+        print('{} is up to date'.format(name))
+    else:
+        print('Merging {}...'.format(name))
+        with store.writer(dataset) as out:
+            for job in jobs:
+                out.append(store.arrays(store.filename(replicates, job)))
+        ledger.merged(name, jobs)
+    ledger.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('directory',
+        help='The directory containing the monthly_data_<job>.db files')
+    parser.add_argument('-n', '--name', action='store', dest='name', required=True,
+        help='The name of the dataset to create, e.g., uga-policy-status-quo')
+    parser.add_argument('-c', '--configuration', action='store', dest='configuration', type=int, default=0,
+        help='The configuration id to assign to the replicates (default 0)')
+    parser.add_argument('-j', '--jobs', action='store', dest='jobs', type=int, default=os.cpu_count(),
+        help='The number of databases to ingest in parallel (default is the number of CPUs)')
+    args = parser.parse_args()
+    main(args.directory, args.name, args.configuration, args.jobs)
@@ -3,11 +3,18 @@
 # loader.py
 # 
 # Load the relevant data from the database.
+import argparse
+import functools
 import os
 import pandas as pd
 import sys
 
 import include.common as shared
+import include.store as store
+from include.download import download, query
+from include.genotypes import queries
+from include.manifest import manifest
+from include.metrics import metrics
 
 # From the PSU-CIDD-MaSim-Support repository
 sys.path.insert(1, '../../PSU-CIDD-MaSim-Support/Python/include')
@@ -18,6 +25,16 @@ from utility import progressBar
 DATASET_DIRECTORY = 'data/datasets'
 REPLICATE_DIRECTORY = 'data/replicates'
 REPLICATES_LIST = 'data/uga-loader-replicates.csv'
+MANIFEST = 'data/uga-loader-manifest.jsonl'
+METRICS_DIRECTORY = 'data/metrics'
+
+# Number of replicates to request in a single query when running in batch mode, 
+# and the number of rows the server-side cursor fetches at a time
+BATCH_SIZE = 25
+CURSOR_ITERSIZE = 10000
+
+# Default number of concurrent downloads
+JOBS = 1
 
 
 def get_replicates(studyId):
@@ -35,70 +52,44 @@ def get_replicates(studyId):
       ORDER BY c.id desc, c.studyid, c.filename, r.id"""
     return select(shared.CONNECTION, sql, {'studyId':studyId})
 
-def get_replicate(replicateId):
-    sql = """
-      SELECT *, 
-        (weightedoccurrences_469y + weightedoccurrences_675v) as weightedsum,
-        (occurrences_469Y + occurrences_675v) as occurrences_sum
-      FROM (
-        SELECT c.id as configurationid, sd.replicateid, sd.dayselapsed,
-          sd.district, infectedindividuals,  clinicalepisodes, 
-          CASE WHEN y_mutant.occurrences IS NULL THEN 0 else y_mutant.occurrences END AS occurrences_469y,
-          CASE WHEN y_mutant.clinicaloccurrences IS NULL THEN 0 else y_mutant.clinicaloccurrences END AS clinicaloccurrences_469y,
-          CASE WHEN y_mutant.weightedoccurrences IS NULL THEN 0 else y_mutant.weightedoccurrences END AS weightedoccurrences_469y,
-          CASE WHEN v_mutant.occurrences IS NULL THEN 0 else v_mutant.occurrences END AS occurrences_675v,
-          CASE WHEN v_mutant.clinicaloccurrences IS NULL THEN 0 else v_mutant.clinicaloccurrences END AS clinicaloccurrences_675v,
-          CASE WHEN v_mutant.weightedoccurrences IS NULL THEN 0 else v_mutant.weightedoccurrences END AS weightedoccurrences_675v,		  
-          treatments,
-          treatmentfailures
-        FROM (
-          SELECT md.replicateid, md.dayselapsed, msd.location AS district,
-            sum(msd.infectedindividuals) AS infectedindividuals, 
-            sum(msd.clinicalepisodes) AS clinicalepisodes,
-            sum(msd.treatments) AS treatments,
-            sum(msd.treatmentfailures) as treatmentfailures
-          FROM sim.monthlydata md
-            INNER JOIN sim.monthlysitedata msd on msd.monthlydataid = md.id
-          WHERE md.replicateid = %(replicateId)s
-            AND md.dayselapsed > (7 * 365)
-          GROUP BY md.replicateid, md.dayselapsed, msd.location) sd
-        LEFT JOIN (
-          SELECT md.replicateid, md.dayselapsed, mgd.location AS district,
-          sum(mgd.occurrences) AS occurrences,
-            sum(mgd.clinicaloccurrences) AS clinicaloccurrences,
-            sum(mgd.weightedoccurrences) AS weightedoccurrences
-          FROM sim.monthlydata md
-            INNER JOIN sim.monthlygenomedata mgd on mgd.monthlydataid = md.id
-            INNER JOIN sim.genotype g on g.id = mgd.genomeid
-          WHERE md.replicateid = %(replicateId)s
-            AND md.dayselapsed > (7 * 365)
-            AND g.name ~ '^.....Y..'
-          GROUP BY md.replicateid, md.dayselapsed, mgd.location) y_mutant ON (y_mutant.replicateid = sd.replicateid 
-            AND y_mutant.dayselapsed = sd.dayselapsed
-            AND y_mutant.district = sd.district)
-        LEFT JOIN (
-          SELECT md.replicateid, md.dayselapsed, mgd.location AS district,
-          sum(mgd.occurrences) AS occurrences,
-            sum(mgd.clinicaloccurrences) AS clinicaloccurrences,
-            sum(mgd.weightedoccurrences) AS weightedoccurrences
-          FROM sim.monthlydata md
-            INNER JOIN sim.monthlygenomedata mgd on mgd.monthlydataid = md.id
-            INNER JOIN sim.genotype g on g.id = mgd.genomeid
-          WHERE md.replicateid = %(replicateId)s
-            AND md.dayselapsed > (7 * 365)
-            AND g.name ~ '^......V.'
-          GROUP BY md.replicateid, md.dayselapsed, mgd.location) v_mutant ON (v_mutant.replicateid = sd.replicateid 
-            AND v_mutant.dayselapsed = sd.dayselapsed
-            AND v_mutant.district = sd.district)			
-          INNER JOIN sim.replicate r on r.id = sd.replicateid
-          INNER JOIN sim.configuration c on c.id = r.configurationid
-        WHERE r.endtime is not null
-          AND r.id = %(replicateId)s) iq
-      ORDER BY replicateid, dayselapsed"""
-    return select(shared.CONNECTION, sql, {'replicateId':replicateId})
-
-
-def main(studyId):
+def get_replicate(connection, replicateIds, callback, summary = False):
+    # Query for the replicates one at a time
+    for template, parameters, ids in queries(connection, replicateIds, summary):
+        sql = template.format(filter='= %(replicateId)s')
+        for replicateId in ids:
+            parameters['replicateId'] = replicateId
+            callback(replicateId, query(connection, sql, parameters))
+
+def get_replicates_batch(connection, replicateIds, callback, summary = False):
+    # Query for all of the replicates at once, since the server-side cursor 
+    # returns the rows ordered by replicate, the callback is invoked with the 
+    # complete set of rows for each replicate as soon as it has arrived
+    for template, parameters, ids in queries(connection, replicateIds, summary):
+        sql = template.format(filter='= ANY(%(replicateIds)s)')
+        parameters['replicateIds'] = ids
+
+        # Named cursors are held on the server and fetched in blocks of itersize
+        cursor = connection.cursor(name='replicates')
+        cursor.itersize = CURSOR_ITERSIZE
+        cursor.execute(sql, parameters)
+
+        current, rows, received = None, [], set()
+        for row in cursor:
+            if row[1] != current and len(rows) != 0:
+                callback(current, rows)
+                rows = []
+            current = row[1]
+            received.add(current)
+            rows.append(row)
+        if len(rows) != 0: callback(current, rows)
+        cursor.close()
+
+        # Replicates that returned no rows are still stored so they aren't queried again
+        for replicateId in ids:
+            if replicateId not in received: callback(replicateId, [])
+
+
+def main(studyId, batch, jobs, verify, summary):
     # Make the relevant directories
     os.makedirs(DATASET_DIRECTORY, exist_ok=True)
     os.makedirs(REPLICATE_DIRECTORY, exist_ok=True)
@@ -107,59 +98,73 @@ def main(studyId):
     replicates = get_replicates(5)
     shared.save_csv(REPLICATES_LIST, replicates)
 
-    # Query for the replicates
-    count = 0
-    progressBar(count, len(replicates))
+    # Note the replicates that we still need to download, converting any that 
+    # were previously downloaded as CSV files
+    ledger = manifest(MANIFEST, verify)
+    telemetry = metrics(METRICS_DIRECTORY, 'loader')
+    pending, endtimes = [], {}
     for row in replicates:
-        # Check for the data
-        id = row[3]
-        filename = os.path.join(REPLICATE_DIRECTORY, '{}.csv'.format(id))
-        if os.path.exists(filename): continue
-
-        # Query and store the replicate
-        replicate = get_replicate(id)
-        shared.save_csv(filename, replicate)
+        endtimes[row[3]] = row[5]
+        filename = store.filename(REPLICATE_DIRECTORY, row[3])
+        legacy = os.path.join(REPLICATE_DIRECTORY, '{}.csv'.format(row[3]))
+        if not os.path.exists(filename) and os.path.exists(legacy):
+            try:
+                store.convert(legacy, filename)
+            except ValueError as ex:
+                # The replicate is downloaded again since there is no store file
+                print('Unable to convert replicate {}, {}'.format(row[3], ex))
+        if not ledger.valid(row[3], filename, row[5]): pending.append(row[3])
+
+    # Split the replicates into the chunks handled by each worker
+    size = max(batch, 1)
+    chunks = [pending[ndx:ndx + size] for ndx in range(0, len(pending), size)]
 
-        # Update the status
-        count += 1
-        progressBar(count, len(replicates))
+    # Query for the replicates
+    def save(id, rows):
+        filename = store.filename(REPLICATE_DIRECTORY, id)
+        store.write(filename, rows)
+        ledger.record(id, filename, len(rows), endtimes[id])
+    fetch = functools.partial(get_replicates_batch if batch > 0 else get_replicate, summary = summary)
+    count = download(chunks, fetch, save, jobs, len(replicates), len(replicates) - len(pending), telemetry)
 
     # Complete progress bar for replicates
     if count != len(replicates): progressBar(len(replicates), len(replicates))
     
-    # Merge the replicates into their data sets
+    # Merge the replicates into their data sets when they have changed
     replicates = pd.read_csv(REPLICATES_LIST, header=None)
     for configuration in replicates[2].unique():
-        print('Merging {}...'.format(configuration.replace('.yml', '')))
-        configuration_replicates = replicates[replicates[2] == configuration]
-        filename = os.path.join(DATASET_DIRECTORY, configuration.replace('yml', 'csv'))
-        merge_data(configuration_replicates[3].to_list(), REPLICATE_DIRECTORY, filename)
-
-
-def merge_data(replicates, path, outfile):
+        name = configuration.replace('.yml', '')
+        configuration_replicates = replicates[replicates[2] == configuration][3].to_list()
+        filename = store.filename(DATASET_DIRECTORY, name)
+        if ledger.current(name, filename, configuration_replicates): continue
+        print('Merging {}...'.format(name))
+        merge_data(configuration_replicates, REPLICATE_DIRECTORY, filename, telemetry)
+        ledger.merged(name, configuration_replicates)
+    ledger.close()
+    telemetry.close()
+
+
+def merge_data(replicates, path, outfile, telemetry = None):
   # Let the user know we haven't hung
-  count = 0
-  progressBar(count, len(replicates))
-
-  # Read the first file so we have something to append to
-  infile = os.path.join(path, "{}.csv".format(replicates[0]))
-  data = pd.read_csv(infile, header=None)
-
-  for replicate in replicates[1:]:
-    # Load the file from the disk
-    infile = os.path.join(path, "{}.csv".format(replicate))
-    working = pd.read_csv(infile, header=None)
-    data = data.append(working)
-
-    # Update the status
-    count += 1
-    progressBar(count, len(replicates))
-    
-  # Save and produce the final status bar
-  data.to_csv(outfile, header=None, index=False)
-  if count != len(replicates): progressBar(len(replicates), len(replicates))
+  progressBar(0, len(replicates))
+  def appended(index, seconds, rows):
+    if telemetry is not None:
+      telemetry.merge(os.path.basename(outfile), replicates[index], seconds, rows)
+    progressBar(index + 1, len(replicates))
 
+  # Stream each of the replicates to the output so only one is in memory at a time
+  store.merge([store.filename(path, replicate) for replicate in replicates], outfile, appended)
 
 
 if __name__ == '__main__':
-    main(5)
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', '--batch', action='store', dest='batch', type=int, default=BATCH_SIZE,
+        help='The number of replicates to query at once, 0 to query them one at a time (default {})'.format(BATCH_SIZE))
+    parser.add_argument('-j', '--jobs', action='store', dest='jobs', type=int, default=JOBS,
+        help='The number of replicates to download concurrently (default {})'.format(JOBS))
+    parser.add_argument('--verify', action='store_true', dest='verify',
+        help='Verify the checksum of every replicate instead of only those that have changed on disk')
+    parser.add_argument('--summary', action='store_true', dest='summary',
+        help='Read the replicates from the sim.districtsummary table when they have been summarized')
+    args = parser.parse_args()
+    main(5, args.batch, args.jobs, args.verify, args.summary)
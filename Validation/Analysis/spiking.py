@@ -10,43 +10,42 @@ import matplotlib.dates
 import matplotlib.pyplot as plt
 import numpy as np
 import os
-import pandas as pd
+import queue
+import threading
 
 from include.spike.calibration import calibration
 from include.spike.dual import dual_spike
 from include.spike.district import district
 from include.spike.loader import loader
+from include.spike.scoring import scoring
 import include.common as shared
+import include.reference as reference
+import include.spike.configurations as configurations
 
 
 def plot_genotypes():
   
-  def plot(filename, color):
+  def plot(observed, color):
     row, col = 0, 0
-    data = pd.read_csv(filename)
     for district in districts:
-      # Plot the frequency points
-      plt.sca(axes[row, col])
-      for index, data_row in data[data.District == district].iterrows():
-        x = datetime.datetime(data_row.Year, 1, 1)
-        y = data_row.Frequency
-        plt.scatter(x, y, color = color, s = 100, zorder = 99)
+      # Plot the frequency points at the start of the survey year
+      index = observed.points(district)
+      x = [datetime.datetime(int(year), 1, 1) for year in observed.year[index]]
+      axes[row, col].scatter(x, observed.frequency[index], color = color, s = 100, zorder = 99)
       # Move to the next plot
       row, col = shared.increment(row, col)
-    return max(data.Frequency)
+    return max(observed.frequency)
       
   # Generate the list of unique districts
-  districts = pd.read_csv(shared.MUTATIONS_469Y).District.unique()  
-  districts = np.append(districts, pd.read_csv(shared.MUTATIONS_675V).District.unique())
-  districts = np.unique(districts)
+  districts = np.unique(reference.mutations('469Y').districts + reference.mutations('675V').districts)
   
   # Prepare the figure
   matplotlib.rc_file('../Scripts/matplotlibrc-line')
   figure, axes = plt.subplots(3, 5)
   
   # Add the data points
-  ymax = max(plot(shared.MUTATIONS_469Y, 'black'),
-             plot(shared.MUTATIONS_675V, 'red'))
+  ymax = max(plot(reference.mutations('469Y'), 'black'),
+             plot(reference.mutations('675V'), 'red'))
   
   # Format the plots
   row, col = 0, 0
@@ -72,6 +71,68 @@ def plot_genotypes():
   plt.close()
 
 
+def selected(args):
+  # Return the configurations that match the --where criteria, or all of them
+  if not args.where: return configurations.load()
+  items = configurations.catalog().items(args.where)
+  print('{} configurations match {}'.format(len(items), ', '.join(''.join(entry) for entry in args.where)))
+  return items
+
+
+def pipeline(args):
+  # Plot each configuration as soon as all of its replicates are available, the
+  # loader runs in the background and reports the replicates through the queue
+  available, failure = queue.Queue(), []
+  def load():
+    try:
+      loader().load(args.jobs, args.verify, args.summary, available.put)
+    except BaseException as ex:
+      failure.append(ex)
+    finally:
+      available.put(None)
+  thread = threading.Thread(target = load)
+  thread.start()
+
+  # The plots for each configuration, the plotting stays on this thread since
+  # matplotlib is not thread safe
+  plots = {
+    'c' : [lambda item: item.is_calibration(), calibration().plot],
+    'd' : [lambda item: item.is_spike(), dual_spike().plot],
+    's' : [lambda item: item.is_spike(), lambda item: [district().plot(item, mutation) for mutation in ['469Y', '675V']]]
+  }
+  select, plot = plots[args.type]
+
+  # The replicates list is written before the first replicate is reported
+  remaining, waiting = None, {}
+  while True:
+    id = available.get()
+    if id is None: break
+    if remaining is None:
+      items = [item for item in selected(args) if select(item)]
+      remaining = { item.id : len(item.replicates) for item in items }
+      waiting = { replicate : item for item in items for replicate in item.replicates }
+    if id not in waiting: continue
+
+    # Plot the configuration once the last of its replicates is reported
+    item = waiting[id]
+    remaining[item.id] -= 1
+    if remaining[item.id] != 0: continue
+    try:
+      plot(item)
+    except Exception as ex:
+      print('\nError plotting configuration {}, {}'.format(item.id, item.filename))
+      print(ex)
+  thread.join()
+
+  # Report any error from the loader rather than the missing replicates it caused
+  if len(failure) != 0: raise failure[0]
+
+  # Note anything that could not be plotted since it is missing replicates
+  for item in set(waiting.values()):
+    if remaining[item.id] != 0:
+      print('Configuration {} was not plotted, {} replicates are missing'.format(item.filename, remaining[item.id]))
+
+
 def main(args):
   # Perform any common setup
   if not os.path.exists(os.path.join(shared.PLOTS_DIRECTORY, '469Y')): 
@@ -79,19 +140,30 @@ def main(args):
   if not os.path.exists(os.path.join(shared.PLOTS_DIRECTORY, '675V')):
     os.makedirs(os.path.join(shared.PLOTS_DIRECTORY, '675V'))
 
+  # Overlap the download and plotting if requested
+  if args.pipeline:
+    if args.type not in ['c', 'd', 's']:
+      print('The pipeline can only be used with the c, d, or s types')
+      return
+    pipeline(args)
+    return
+
   # Everything goes through the same loader
-  loader().load()
+  loader().load(args.jobs, args.verify, args.summary)
 
   # Hand things off to the correct processing
   if args.type == 'c':
-    calibration().process()
+    calibration().process(selected(args))
   elif args.type == 'd':
-    dual_spike().process()
+    dual_spike().process(selected(args))
   elif args.type == 's':
-    district().process('469Y')
-    district().process('675V')
+    items = selected(args)
+    district().process('469Y', items)
+    district().process('675V', items)
   elif args.type == 'g':
     plot_genotypes()    
+  elif args.type == 'r':
+    scoring().process(selected(args))
   else:
     print('Unknown type parameter, {}'.format(args.type))
      
@@ -100,5 +172,15 @@ if __name__ == '__main__':
   # Parse the parameters and defer to the main function
   parser = argparse.ArgumentParser()
   parser.add_argument('-t', action='store', dest='type', required=True,
-    help='The type of plots to generate, c for calibration, d for dual spiking, or s for single district')
+    help='The type of plots to generate, c for calibration, d for dual spiking, or s for single district, or r to rank the spike studies without plotting')
+  parser.add_argument('-j', '--jobs', action='store', dest='jobs', type=int, default=1,
+    help='The number of replicates to download concurrently (default 1)')
+  parser.add_argument('--verify', action='store_true', dest='verify',
+    help='Verify the checksum of every replicate instead of only those that have changed on disk')
+  parser.add_argument('--summary', action='store_true', dest='summary',
+    help='Read the replicates from the sim.districtsummary table when they have been summarized')
+  parser.add_argument('--pipeline', action='store_true', dest='pipeline',
+    help='Plot each configuration as soon as its replicates are downloaded, rather than after the download')
+  parser.add_argument('-w', '--where', action='append', dest='where', type=configurations.criterion, default=[],
+    help='Only process the configurations that match the catalog criterion, e.g., district=lamwo or spike>=0.05, may be repeated')
   main(parser.parse_args())
@@ -0,0 +1,42 @@
+# test_configurations.py
+#
+# Tests for the parsing of the spike study file names.
+import pytest
+
+# The configurations need the database helpers from the PSU-CIDD-MaSim-Support repository
+configurations = pytest.importorskip('include.spike.configurations')
+
+
+@pytest.mark.parametrize('filename, expected', [
+  ('uga-spike-lamwo-0.5.yml', (2009, 0.075, 0.5, None)),
+  ('uga-spike-lamwo-2009-0.075-0.5.yml', (2009, 0.075, 0.5, None)),
+  ('uga-spike-lamwo-2009-0.075-0.5v2.yml', (2009, 0.075, 0.5, '2')),
+  ('uga-spike-lamwo-2014-0.05-0.25_v3.yml', (2014, 0.05, 0.25, '3')),
+  ('uga-spike-lamwo-2009-0.075-0.5v.yml', (None, None, None, None)),
+  ('uga-spike-lamwo-2009-x-0.5.yml', (None, None, None, None)),
+  ('uga-cal-acholi-0.1-2.yml', (None, None, None, None))
+])
+def test_parse(filename, expected):
+  assert configurations.parse(filename.replace('.yml', '').split('-')) == expected
+
+
+def test_catalog(tmp_path):
+  replicates = tmp_path / 'replicates.csv'
+  replicates.write_text('\n'.join([
+    '10,4,uga-cal-acholi-0.1-2.yml,100,a,b',
+    '11,3,uga-spike-lamwo-2014-0.05-0.25.yml,101,a,b',
+    '11,3,uga-spike-lamwo-2014-0.05-0.25.yml,102,a,b',
+    '12,3,uga-spike-lamwo-2009-0.075-0.5v2.yml,103,a,b',
+    '12,3,uga-spike-lamwo-2009-0.075-0.5v2.yml,104,a,b',
+    '13,3,uga-spike-gulu-2009-0.1-0.5.yml,105,a,b',
+    '13,3,uga-spike-gulu-2009-0.1-0.5.yml,106,a,b']) + '\n')
+  catalog = configurations.catalog(str(replicates), str(tmp_path / 'catalog.npz'))
+  assert catalog.table['replicates'].tolist() == [1, 2, 2, 2]
+  assert catalog.table['population'][2] == 0.5
+
+  # Selections, and the same results from the catalog on disk
+  criteria = [configurations.criterion('district=Lamwo'), configurations.criterion('spike>=0.05')]
+  assert catalog.select(criteria)['configurationid'].tolist() == [11, 12]
+  catalog = configurations.catalog(str(replicates), str(tmp_path / 'catalog.npz'))
+  assert [item.id for item in catalog.items(criteria)] == [11, 12]
+  assert [item.id for item in catalog.items([configurations.criterion('calibration=1')])] == [10]
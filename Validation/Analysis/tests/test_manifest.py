@@ -0,0 +1,55 @@
+# test_manifest.py
+#
+# Tests for the replicate manifest used to resume the loaders.
+import os
+
+import include.store as store
+from include.manifest import manifest
+
+from test_store import ROW
+
+
+def test_valid(tmp_path):
+  filename = str(tmp_path / '1.npz')
+  store.write(filename, [ROW])
+  ledger = manifest(str(tmp_path / 'manifest.jsonl'))
+
+  # Not present, then recorded
+  assert not ledger.valid(2, str(tmp_path / '2.npz'), 'end')
+  ledger.record(1, filename, 1, 'end')
+  assert ledger.valid(1, filename, 'end')
+
+  # The replicate was run again
+  assert not ledger.valid(1, filename, 'later')
+
+  # The file changed on disk, and again when the checksum is always verified
+  store.write(filename, [ROW, ROW])
+  assert not ledger.valid(1, filename, 'end')
+  ledger.close()
+  ledger = manifest(str(tmp_path / 'manifest.jsonl'), verify = True)
+  os.utime(filename, ns = (ledger.replicates[1]['mtime'], ledger.replicates[1]['mtime']))
+  assert not ledger.valid(1, filename, 'end')
+  ledger.close()
+
+
+def test_valid_without_entry(tmp_path):
+  ledger = manifest(str(tmp_path / 'manifest.jsonl'))
+
+  # Readable files are adopted
+  filename = str(tmp_path / '1.npz')
+  store.write(filename, [ROW, ROW])
+  assert ledger.valid(1, filename, 'end')
+  assert ledger.replicates[1]['rows'] == 2
+
+  # Anything else is deleted so it is downloaded again
+  for ndx, contents in enumerate([b'', b'not an archive']):
+    filename = str(tmp_path / '{}.npz'.format(ndx + 2))
+    with open(filename, 'wb') as file: file.write(contents)
+    assert not ledger.valid(ndx + 2, filename, 'end')
+    assert not os.path.exists(filename)
+    assert ndx + 2 not in ledger.replicates
+  filename = str(tmp_path / '4.npz')
+  store.write(filename, [])
+  assert not ledger.valid(4, filename, 'end')
+  assert not os.path.exists(filename)
+  ledger.close()
@@ -0,0 +1,81 @@
+# test_store.py
+#
+# Round-trip tests for the columnar store, and the rejection of incomplete data.
+import numpy as np
+import pytest
+
+import include.store as store
+
+# A complete row in the replicate query layout
+ROW = [1, 2, 3000, 4, 100, 10, 5, 1, 0.5, 6, 2, 1.5, 8, 1, 2.0, 11]
+
+
+def write_csv(path, rows):
+  path.write_text(''.join(','.join(str(value) for value in row) + '\n' for row in rows))
+  return str(path)
+
+
+def test_write_round_trip(tmp_path):
+  filename = str(tmp_path / 'replicate.npz')
+  store.write(filename, [ROW, ROW])
+  data = store.arrays(filename)
+  assert list(data.keys()) == list(store.SCHEMA.keys())
+  for ndx, (column, dtype) in enumerate(store.SCHEMA.items()):
+    assert data[column].dtype == np.dtype(dtype)
+    assert data[column].tolist() == [ROW[ndx]] * 2
+  assert store.check(filename) == 2
+
+
+def test_write_rejects_missing_values(tmp_path):
+  filename = str(tmp_path / 'replicate.npz')
+  for row in [ROW[:4] + [None] + ROW[5:], ROW[:8] + [float('nan')] + ROW[9:], ROW[:-1]]:
+    with pytest.raises(ValueError):
+      store.write(filename, [ROW, row])
+  assert not tmp_path.joinpath('replicate.npz').exists()
+
+
+def test_convert_round_trip(tmp_path):
+  filename = str(tmp_path / 'replicate.npz')
+  store.convert(write_csv(tmp_path / 'replicate.csv', [ROW, ROW]), filename)
+  assert store.read(filename).values.tolist() == [ROW, ROW]
+
+
+@pytest.mark.parametrize('rows', [
+  [ROW, ROW[:7]],                              # Truncated row
+  [ROW, ROW[:8] + [''] + ROW[9:]],             # Missing float value
+  [ROW, ROW[:4] + [''] + ROW[5:]],             # Missing integer value
+  [ROW, ROW + [1]],                            # Extra value
+  [ROW, ROW[:4] + ['x'] + ROW[5:]],            # Not a number
+  []                                           # Empty file
+])
+def test_convert_rejects_bad_input(tmp_path, rows):
+  filename = str(tmp_path / 'replicate.npz')
+  with pytest.raises(ValueError):
+    store.convert(write_csv(tmp_path / 'replicate.csv', rows), filename)
+  assert not tmp_path.joinpath('replicate.npz').exists()
+
+
+def test_check_rejects_bad_files(tmp_path):
+  # Empty store
+  filename = str(tmp_path / 'empty.npz')
+  store.write(filename, [])
+  with pytest.raises(ValueError):
+    store.check(filename)
+
+  # Missing column and columns of different lengths
+  filename = str(tmp_path / 'partial.npz')
+  data = store.columns([ROW, ROW])
+  np.savez(filename, **{ column : values for column, values in data.items() if column != 'treatments' })
+  with pytest.raises(ValueError):
+    store.check(filename)
+  data['treatments'] = data['treatments'][:1]
+  np.savez(filename, **data)
+  with pytest.raises(ValueError):
+    store.check(filename)
+
+  # Sentinel from an invalid cast
+  data = store.columns([ROW, ROW])
+  data['district'][1] = np.iinfo(np.int32).min
+  np.savez(filename, **data)
+  with pytest.raises(ValueError):
+    store.check(filename)
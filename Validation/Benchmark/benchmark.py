@@ -0,0 +1,172 @@
+#!/usr/bin/python3
+
+# benchmark.py
+#
+# Time the stages of the analysis data path against the synthetic replicates
+# written by generate.py, and record the peak memory of each stage. Each stage
+# runs in a fresh process so the peak resident set size belongs to that stage
+# alone, and the results are written to a JSON file that can be compared with
+# the results from another run.
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import time
+
+import generate
+
+# Paths to the scripts being measured
+VALIDATION = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+PATHS = [
+  os.path.join(VALIDATION, 'Analysis'),
+  os.path.join(VALIDATION, 'Analysis', 'include'),
+  os.path.join(VALIDATION, 'Plotting')
+]
+
+# Default file for the results
+RESULTS = 'benchmark-results.json'
+
+
+def _merge(workspace, description):
+  # The merge used by loader.merge_data, without the database dependencies of the loader
+  import store
+  replicates = os.path.join(workspace, 'Analysis', 'data', 'replicates')
+  for name, ids in description['policies'].items():
+    outfile = store.filename(os.path.join(workspace, 'Analysis', 'data', 'datasets'), 'uga-policy-' + name)
+    store.merge([store.filename(replicates, id) for id in ids], outfile)
+
+def _load_cold(workspace, description):
+  import include.uganda as uganda
+  shutil.rmtree('cache', ignore_errors=True)
+  os.makedirs('cache')
+  uganda.load_all_datasets()
+
+def _load_warm(workspace, description):
+  import include.uganda as uganda
+  uganda.load_all_datasets()
+
+def _summary(workspace, description):
+  from include.summary import summary
+  summary().generate()
+
+def _violin(workspace, description):
+  # The data preparation of the violin plots, which is all done by endpoints.py
+  import include.endpoints as endpoints
+  import include.uganda as uganda
+  data, dates = uganda.load_all_datasets()
+  for bounds in endpoints.ENDPOINTS.values():
+    range = dates[bounds[0]:bounds[1]]
+    endpoints.treatment_failures(data, [range])
+    endpoints.frequencies(data, list(uganda.DATASET_LAYOUT['mutations']), [range[-1]])
+
+# The stages in the order they are run, and if they need all of the policies
+STAGES = {
+  'merge_data'        : [_merge, False],
+  'load_cold'         : [_load_cold, False],
+  'load_warm'         : [_load_warm, False],
+  'summary.generate'  : [_summary, True],
+  'violin.prepare'    : [_violin, True]
+}
+
+
+def kilobytes():
+  # The peak resident set size of this process, reported in KB on Linux
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def stage(name, workspace, description, results):
+  # Worker process, the Plotting scripts expect to be run from their directory
+  for path in PATHS: sys.path.insert(1, path)
+  os.chdir(os.path.join(workspace, 'Plotting'))
+
+  # Import everything before measuring so the imports are part of the baseline, only
+  # NumPy and pandas are needed so the benchmark runs without a database
+  import store
+  import include.endpoints
+  import include.uganda
+  import include.summary
+
+  baseline = kilobytes()
+  start = time.perf_counter()
+  STAGES[name][0](workspace, description)
+  results.put({
+    'seconds'     : time.perf_counter() - start,
+    'baseline_kb' : baseline,
+    'peak_kb'     : kilobytes()
+  })
+
+
+def compare(baseline, current):
+  """Print the change in each stage between the baseline and current results."""
+  print('{:<20} {:>12} {:>12} {:>8} {:>12} {:>12} {:>8}'.format('Stage', 'Base (s)', 'Now (s)', 'Ratio', 'Base (MB)', 'Now (MB)', 'Ratio'))
+  for name in STAGES:
+    if name not in baseline['stages'] or name not in current['stages']: continue
+    before, after = baseline['stages'][name], current['stages'][name]
+    print('{:<20} {:>12.2f} {:>12.2f} {:>8.2f} {:>12.1f} {:>12.1f} {:>8.2f}'.format(name,
+      before['seconds'], after['seconds'], after['seconds'] / before['seconds'],
+      before['peak_kb'] / 1024, after['peak_kb'] / 1024, after['peak_kb'] / before['peak_kb']))
+  if baseline['scale'] != current['scale']:
+    print('NOTE that the runs were at different scales: {} and {}'.format(baseline['scale'], current['scale']))
+
+
+def main(workspace, output, repeat, baseline):
+  workspace = os.path.abspath(workspace)
+  with open(os.path.join(workspace, generate.DESCRIPTION), 'r') as file:
+    description = json.load(file)
+  complete = len(description['policies']) == len(generate.POLICY_NAMES)
+
+  results = {
+    'date'      : datetime.datetime.now().isoformat(),
+    'machine'   : {
+      'platform'  : platform.platform(),
+      'processor' : platform.processor(),
+      'cpus'      : os.cpu_count(),
+      'python'    : platform.python_version()
+    },
+    'scale'     : description['scale'],
+    'stages'    : {}
+  }
+
+  # Run each stage in a fresh process, keeping the fastest of the repeats
+  context = multiprocessing.get_context('spawn')
+  for name, (_, policies) in STAGES.items():
+    if policies and not complete:
+      print('Skipping {}, it requires all {} policies'.format(name, len(generate.POLICY_NAMES)))
+      continue
+    for ndx in range(repeat):
+      print('Running {} ({} of {})...'.format(name, ndx + 1, repeat))
+      queue = context.Queue()
+      process = context.Process(target=stage, args=(name, workspace, description, queue))
+      process.start()
+      process.join()
+      if process.exitcode != 0:
+        raise RuntimeError('{} failed with exit code {}'.format(name, process.exitcode))
+      result = queue.get()
+      if name not in results['stages'] or result['seconds'] < results['stages'][name]['seconds']:
+        results['stages'][name] = result
+    print('{}: {:.2f}s, peak {:.1f} MB'.format(name, results['stages'][name]['seconds'], results['stages'][name]['peak_kb'] / 1024))
+
+  with open(output, 'w') as out:
+    json.dump(results, out, indent=2)
+
+  if baseline is not None:
+    with open(baseline, 'r') as file:
+      compare(json.load(file), results)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-w', '--workspace', action='store', dest='workspace', default=generate.WORKSPACE,
+    help='The workspace created by generate.py (default {})'.format(generate.WORKSPACE))
+  parser.add_argument('-o', '--output', action='store', dest='output', default=RESULTS,
+    help='The file to write the results to (default {})'.format(RESULTS))
+  parser.add_argument('-r', '--repeat', action='store', dest='repeat', type=int, default=1,
+    help='The number of times to run each stage, the fastest is kept (default 1)')
+  parser.add_argument('-c', '--compare', action='store', dest='baseline',
+    help='Results from a previous run to compare against')
+  args = parser.parse_args()
+  main(args.workspace, args.output, args.repeat, args.baseline)
@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+
+# generate.py
+#
+# Generate synthetic replicates in the layout of the replicate query so that the
+# performance of the analysis data path can be measured without the database. The
+# workspace mirrors the Validation directory, so the scripts can be run against it
+# without changing their relative paths.
+import argparse
+import json
+import numpy as np
+import os
+import sys
+
+# The columnar store is shared with the Analysis scripts
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../Analysis/include'))
+import store
+
+# Default scale, matching the policy study
+POLICIES = 11
+REPLICATES = 100
+DISTRICTS = 146
+MONTHS = 250
+
+# The summary reports on the last 15 years, so at least that many months are needed
+MINIMUM_MONTHS = 15 * 12
+
+# Default location of the workspace and the description of what was generated
+WORKSPACE = 'data/workspace'
+DESCRIPTION = 'benchmark.json'
+
+# The policies, in the same order as uganda.LABELS so the summary can find them
+POLICY_NAMES = [
+  'status-quo', 'sft-al', 'sft-asaq', 'sft-dhappq', 'mft-al-25-asaq-75', 'mft-al-50-asaq-50',
+  'mft-al-75-asaq-25', 'mft-al-75-dhappq-25', 'mft-asaq-75-dhappq-25', 'tact-alaq', 'tact-asmqppq'
+]
+
+# The model starts in 2004, and the replicate query only returns the data after
+# the burn-in, so the months start in 2011
+MODEL_START = np.datetime64('2004-01-01')
+FIRST_MONTH = np.datetime64('2011-01')
+
+
+def replicate(rng, configurationId, replicateId, districts, months):
+  """Return the columns for a synthetic replicate."""
+  # Days elapsed at the end of each month, repeated for each district
+  ends = (np.arange(FIRST_MONTH, FIRST_MONTH + months) + 1).astype('datetime64[D]') - 1
+  days = (ends - MODEL_START).astype(np.int32)
+  count = months * districts
+
+  # Prevalence varies by district, and the alleles spread logistically over time
+  population = rng.integers(5000, 50000, districts)
+  infected = rng.poisson(np.tile(population, months))
+  clinical = rng.binomial(infected, 0.1)
+  treatments = rng.binomial(clinical, 0.8)
+  failures = rng.binomial(treatments, 0.1)
+  growth = np.repeat(np.arange(months), districts) / months
+  frequency469y = 1 / (1 + np.exp(-10 * (growth - rng.uniform(0.5, 1.5, count))))
+  frequency675v = 1 / (1 + np.exp(-10 * (growth - rng.uniform(0.5, 1.5, count))))
+
+  data = {
+    'configurationid'           : np.full(count, configurationId),
+    'replicateid'               : np.full(count, replicateId),
+    'dayselapsed'               : np.repeat(days, districts),
+    'district'                  : np.tile(np.arange(1, districts + 1), months),
+    'infectedindividuals'       : infected,
+    'clinicalepisodes'          : clinical,
+    'weightedoccurrences_469y'  : infected * frequency469y,
+    'weightedoccurrences_675v'  : infected * frequency675v,
+    'treatments'                : treatments,
+    'treatmentfailures'         : failures
+  }
+  for allele in ['469y', '675v']:
+    data['occurrences_' + allele] = np.rint(data['weightedoccurrences_' + allele] * 1.2)
+    data['clinicaloccurrences_' + allele] = rng.binomial(clinical, np.minimum(data['weightedoccurrences_' + allele] / np.maximum(infected, 1), 1))
+  data['weightedsum'] = data['weightedoccurrences_469y'] + data['weightedoccurrences_675v']
+  data['occurrences_sum'] = data['occurrences_469y'] + data['occurrences_675v']
+  return data
+
+
+def main(workspace, policies, replicates, districts, months, seed):
+  if policies > len(POLICY_NAMES):
+    sys.stderr.write('At most {} policies can be generated\n'.format(len(POLICY_NAMES)))
+    sys.exit(1)
+  if months < MINIMUM_MONTHS:
+    sys.stderr.write('At least {} months must be generated\n'.format(MINIMUM_MONTHS))
+    sys.exit(1)
+
+  # Make the relevant directories
+  directory = os.path.join(workspace, 'Analysis', 'data', 'replicates')
+  os.makedirs(directory, exist_ok=True)
+  os.makedirs(os.path.join(workspace, 'Analysis', 'data', 'datasets'), exist_ok=True)
+  os.makedirs(os.path.join(workspace, 'Plotting'), exist_ok=True)
+
+  # Generate the replicates for each policy
+  rng = np.random.default_rng(seed)
+  description = {
+    'scale'     : {'policies': policies, 'replicates': replicates, 'districts': districts, 'months': months, 'seed': seed},
+    'policies'  : {}
+  }
+  replicateId = 0
+  for configurationId, name in enumerate(POLICY_NAMES[:policies]):
+    print('Generating {}...'.format(name))
+    ids = []
+    for _ in range(replicates):
+      replicateId += 1
+      store.write(store.filename(directory, replicateId), replicate(rng, configurationId, replicateId, districts, months))
+      ids.append(replicateId)
+    description['policies'][name] = ids
+
+  # Note what was generated for the benchmark runner
+  with open(os.path.join(workspace, DESCRIPTION), 'w') as out:
+    json.dump(description, out, indent=2)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-w', '--workspace', action='store', dest='workspace', default=WORKSPACE,
+    help='The directory to generate the replicates in (default {})'.format(WORKSPACE))
+  parser.add_argument('-p', '--policies', action='store', dest='policies', type=int, default=POLICIES,
+    help='The number of policies (default {})'.format(POLICIES))
+  parser.add_argument('-r', '--replicates', action='store', dest='replicates', type=int, default=REPLICATES,
+    help='The number of replicates per policy (default {})'.format(REPLICATES))
+  parser.add_argument('-d', '--districts', action='store', dest='districts', type=int, default=DISTRICTS,
+    help='The number of districts (default {})'.format(DISTRICTS))
+  parser.add_argument('-m', '--months', action='store', dest='months', type=int, default=MONTHS,
+    help='The number of months (default {})'.format(MONTHS))
+  parser.add_argument('-s', '--seed', action='store', dest='seed', type=int, default=0,
+    help='The seed for the random number generator (default 0)')
+  args = parser.parse_args()
+  main(args.workspace, args.policies, args.replicates, args.districts, args.months, args.seed)
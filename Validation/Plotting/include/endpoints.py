@@ -0,0 +1,109 @@
+# endpoints.py
+#
+# This file contains the vectorized extraction of the endpoint values used by the
+# summary tables and violin plots from the national datasets.
+import numpy as np
+import pandas as pd
+
+import include.uganda as uganda
+
+# The endpoints of the violin plots
+ENDPOINTS = {
+    # Endpoint : First Date Offset, Last Date Offset, Numeric Value
+    'Three' : [-96, -84, 3],
+    'Five'  : [-72, -60, 5],
+    'Ten'   : [-12, None, 10]
+}
+
+
+def _index(days, dates):
+    # Return the index of each of the dates in the sorted days, raising an error
+    # for any date that is not one of the days rather than using a neighbor
+    dates = np.asarray(dates)
+    index = np.searchsorted(days, dates)
+    found = index < len(days)
+    found[found] = days[index[found]] == dates[found]
+    if not found.all():
+        raise ValueError('Dates not in the dataset: {}'.format(dates[~found].tolist()))
+    return index
+
+
+def _grid(df, column, dates):
+    # Return the (replicate, date) values of the column, the national datasets have
+    # one row per replicate and date so the values can be scattered into place
+    replicates, rows = pd.factorize(df.replicate)[0], len(df.replicate.unique())
+    grid = np.zeros((rows, len(dates)))
+    grid[replicates, _index(dates, df.days.to_numpy())] = df[column]
+    return grid
+
+
+def _stack(values):
+    # Stack the per-policy (window, replicate) arrays, padding with NaN since the
+    # policies may have different numbers of replicates
+    replicates = max(value.shape[1] for value in values)
+    result = np.full((len(values), values[0].shape[0], replicates), np.nan)
+    for ndx, value in enumerate(values):
+        result[ndx, :, :value.shape[1]] = value
+    return result
+
+
+def replicates(data, keys = None):
+    """Return the number of replicates of each policy, the columns of the results
+    beyond these are the padding added by _stack.
+
+    data - The national datasets, as returned by uganda.load_all_datasets
+    keys - The policies in the order to return them, default is uganda.LABELS"""
+    if keys is None: keys = list(uganda.LABELS.keys())
+    return [len(data[key].replicate.unique()) for key in keys]
+
+
+def treatment_failures(data, windows, keys = None):
+    """Return the (policy, window, replicate) percent treatment failures for the
+    datasets. Each window is a sequence of dates where the first and last are the
+    inclusive bounds, the replicates of a policy with fewer than the maximum are NaN.
+
+    data - The national datasets, as returned by uganda.load_all_datasets
+    windows - The list of windows to calculate the treatment failures over
+    keys - The policies in the order to return them, default is uganda.LABELS"""
+    if keys is None: keys = list(uganda.LABELS.keys())
+
+    results = []
+    for key in keys:
+        # Cumulative sums over the dates with a leading zero, so the sum over any
+        # window is the difference between two columns
+        dates = np.sort(data[key].days.unique())
+        treatments = np.pad(np.cumsum(_grid(data[key], 'treatments', dates), axis=1), ((0, 0), (1, 0)))
+        failures = np.pad(np.cumsum(_grid(data[key], 'failures', dates), axis=1), ((0, 0), (1, 0)))
+
+        # Find the bounds of each of the windows
+        start = np.searchsorted(dates, [window[0] for window in windows], side='left')
+        end = np.searchsorted(dates, [window[-1] for window in windows], side='right')
+
+        # Treatment failures are returned as percentages
+        results.append((failures[:, end] - failures[:, start]).T / (treatments[:, end] - treatments[:, start]).T * 100.0)
+    return _stack(results)
+
+
+def frequencies(data, alleles, dates, keys = None):
+    """Return the (policy, date, replicate) allele frequencies on each of the dates,
+    as a dictionary keyed by allele. Each policy is scattered into a grid once, so
+    the cost is independent of the number of alleles and dates requested, the
+    replicates of a policy with fewer than the maximum are NaN.
+
+    data - The national datasets, as returned by uganda.load_all_datasets
+    alleles - The alleles to return the frequencies of, keys of DATASET_LAYOUT['mutations']
+    dates - The dates to return the frequencies on
+    keys - The policies in the order to return them, default is uganda.LABELS"""
+    if keys is None: keys = list(uganda.LABELS.keys())
+
+    results = { allele : [] for allele in alleles }
+    for key in keys:
+        # Find the columns of the dates, and only keep those columns of the infections
+        days = np.sort(data[key].days.unique())
+        columns = _index(days, dates)
+        infections = _grid(data[key], 'infections', days)[:, columns]
+        for allele in alleles:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                frequency = _grid(data[key], allele, days)[:, columns] / infections
+            results[allele].append(frequency.T)
+    return { allele : _stack(values) for allele, values in results.items() }
@@ -0,0 +1,66 @@
+# grid.py
+#
+# This class wraps the 15 panel district layout shared by the district plots, so
+# the figure can be built and formatted once and then reused for each mutation.
+import matplotlib
+import matplotlib.dates
+import matplotlib.pyplot as plt
+import os
+
+import include.uganda as uganda
+
+class grid:
+  ROWS, COLUMNS = 3, 5
+
+  def __init__(self, dates, districts):
+    """Build the formatted figure with a panel for each of the districts.
+
+    dates - The dates of the x-axis as datetime objects
+    districts - The labels of the districts, in the order of the panels"""
+    self.districts = list(districts)
+
+    # Setup to generate the plot
+    matplotlib.rc_file(uganda.LINE_CONFIGURATION)
+    self.figure, self.axes = plt.subplots(self.ROWS, self.COLUMNS)
+    self.panels = [self.axes[ndx // self.COLUMNS, ndx % self.COLUMNS] for ndx in range(len(self.districts))]
+    for axis, district in zip(self.panels, self.districts):
+      axis.title.set_text(district)
+
+    # Format the x, y axis and ticks
+    for row in range(self.ROWS):
+      for col in range(self.COLUMNS):
+        self.axes[row, col].set_ylim([0, 1])
+        self.axes[row, col].set_xlim([min(dates), max(dates)])
+        self.axes[row, col].xaxis.set_major_formatter(matplotlib.dates.DateFormatter("'%y"))
+        if row != 2 and not (row == 1 and col == 4):
+          plt.setp(self.axes[row, col].get_xticklabels(), visible = False)
+        if col != 0:
+          plt.setp(self.axes[row, col].get_yticklabels(), visible = False)
+
+    # Apply the final figure formatting
+    if len(self.districts) < self.ROWS * self.COLUMNS:
+      self.axes[2, 4].set_visible(False)
+    plt.setp(self.axes[2, 0].get_xticklabels()[0], visible = False)
+    self.axes[2, 2].set_xlabel('Model Year')
+
+  def clear(self):
+    """Remove the data from the panels, leaving the formatting in place."""
+    for axis in self.panels:
+      for artist in list(axis.lines) + list(axis.collections): artist.remove()
+
+  def points(self, observed):
+    """Add the observations, from reference.mutations, to the panel of their district."""
+    for axis, district in zip(self.panels, self.districts):
+      index = observed.points(district)
+      axis.scatter(observed.date[index], observed.frequency[index], color = 'black', s = 100, zorder = 99)
+
+  def close(self):
+    """Release the figure."""
+    plt.close(self.figure)
+
+  def save(self, directory, filename, title, ylabel):
+    """Save the figure with the title and y-axis label to the file."""
+    self.figure.suptitle(title, y = 0.94)
+    self.axes[1, 0].set_ylabel(ylabel)
+    os.makedirs(directory, exist_ok=True)
+    self.figure.savefig(os.path.join(directory, filename))
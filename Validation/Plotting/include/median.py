@@ -4,14 +4,18 @@
 import datetime
 import matplotlib
 import matplotlib.pyplot as plt
-import numpy as np
 import os
-import pandas as pd
 import sys
 
+import include.quantiles as quantiles
 import include.uganda as uganda
 from include.uganda import DATASET_LAYOUT
 
+# From the Analysis scripts
+sys.path.insert(1, '../Analysis/include')
+import reference
+import store
+
 # From the PSU-CIDD-MaSim-Support repository
 sys.path.insert(1, '../../PSU-CIDD-MaSim-Support/Python/include')
 from plotting import increment, scale_luminosity
@@ -20,36 +24,33 @@ class median:
   DIRECTORY = os.path.join('out', 'median')
     
   # Various private member variables for formatting
-  labels, title = None, None
+  title = None
+
+  def __init__(self, approximate = False):
+    """approximate - True to stream the replicates through the approximate quantile
+    estimator rather than holding all of them in memory"""
+    self.approximate = approximate
   
-  def __districts(self, filename):
-    # Load relevant data, dates, and labels
-    data = pd.read_csv(filename, header=None)
-    dates = data[DATASET_LAYOUT['dates']].unique().tolist()
-    dates = [datetime.datetime(uganda.MODEL_YEAR, 1, 1) + datetime.timedelta(days=x) for x in dates]
-    self.labels = pd.read_csv(uganda.DISTRICTS_MAPPING)
+  def __districts(self, filename, mutations):
+    # Load relevant data and dates
+    data = uganda.load_districts(filename)
+    dates = [datetime.datetime(uganda.MODEL_YEAR, 1, 1) + datetime.timedelta(days=int(x)) for x in data.dates]
 
-    for mutation, index in DATASET_LAYOUT['mutations'].items():
+    for mutation in mutations:
       print('Creating district plot for {}...'.format(mutation))    
 
-      # Calculate the frequency based on the current mutation
-      data['frequency'] = data[index] / data[DATASET_LAYOUT['infections']]
-    
       # Set the title, labels, and filename for the results
       title = '{}, {}'.format(self.title, mutation)
       ylabel = '{} Frequency'.format(mutation)
       if mutation == 'either':
         title = '{} / Total ART Resistance'.format(self.title)
         ylabel = 'Total ART Resistance Frequency'
-      image_filename = filename.split('/')[-1].replace('uga-policy-', '').replace('.csv', '')
+      image_filename = filename.split('/')[-1].replace('uga-policy-', '').replace(store.EXTENSION, '')
       image_filename += '-{}.png'.format(mutation)
 
       # Prepare the plot
       self.__plot_districts(data, dates, mutation, ylabel, title, image_filename)
 
-    # Free the memory before returning
-    del data
-
 
   def __plot_districts(self, data, dates, mutation, ylabel, title, filename):
     ROWS, COLUMNS = 3, 5
@@ -57,31 +58,22 @@ class median:
     def add_points():
       row, col = 0, 0
       for district in districts:
-        plt.sca(axes[row, col])
-        for index, data_row in mutation_points[mutation_points.District == district].iterrows():
-          x = datetime.datetime(data_row.Year, 9, 30)
-          y = data_row.Frequency
-          plt.scatter(x, y, color = 'black', s = 100, zorder = 99)
+        index = observed.points(district)
+        axes[row, col].scatter(observed.date[index], observed.frequency[index], color = 'black', s = 100, zorder = 99)
         row, col = increment(row, col, COLUMNS)
   
-    # Load the mutation point data 
-    if mutation == 'either':
-      # We use the district with more points if either mutation is plotting
-      mutation_points = pd.read_csv(uganda.MUTATIONS_TEMPLATE.format('675V'))
-    else:  
-      mutation_points = pd.read_csv(uganda.MUTATIONS_TEMPLATE.format(mutation))    
-    districts = mutation_points.District.unique()
+    # Load the mutation point data, the total resistance uses the district with more points
+    observed = reference.mutations(mutation)
+    districts = observed.districts
   
-    # Get the frequency data and transpose it
-    frequencies = {}
-    for replicate in data[DATASET_LAYOUT['replicate']].unique():
-      for district in districts:
-        id = self.labels[self.labels.Label == district].ID.values[0]
-        row = data[(data[DATASET_LAYOUT['district']] == id) & (data[DATASET_LAYOUT['replicate']] == replicate)].frequency.tolist()
-        if district in frequencies.keys():
-          frequencies[district] = np.vstack((frequencies[district], row))
-        else:
-          frequencies[district] = row
+    # Calculate the (quantile, date, district) median and IQR for all of the districts at once,
+    # streaming the replicates from the cube when approximating
+    columns = [data.district(id) for id in observed.ids]
+    if self.approximate:
+      replicates = (data.frequency(mutation, ndx)[:, columns] for ndx in range(len(data.replicates)))
+    else:
+      replicates = data.frequency(mutation)[:, :, columns]
+    lower, median, upper = quantiles.quantiles(replicates, quantiles.IQR, self.approximate)
 
     # Setup to generate the plot
     matplotlib.rc_file(uganda.LINE_CONFIGURATION)
@@ -90,15 +82,11 @@ class median:
 
     # Generate a 15 panel plot while looping over the districts that we have spiking data for
     row, col = 0, 0
-    for district in districts:
-      upper = np.percentile(frequencies[district], 75, axis=0)
-      median = np.percentile(frequencies[district], 50, axis=0)
-      lower = np.percentile(frequencies[district], 25, axis=0)
-
+    for ndx, district in enumerate(districts):
       # Add the data to the plot
-      axes[row, col].plot(dates, median)
+      axes[row, col].plot(dates, median[:, ndx])
       color = scale_luminosity(axes[row, col].lines[-1].get_color(), 1)
-      axes[row, col].fill_between(dates, lower, upper, alpha=0.5, facecolor=color)
+      axes[row, col].fill_between(dates, lower[:, ndx], upper[:, ndx], alpha=0.5, facecolor=color)
       axes[row, col].title.set_text(district)
       row, col = increment(row, col, COLUMNS)
         
@@ -131,13 +119,13 @@ class median:
     plt.close()
   
 
-  def __national(self, filename):
+  def __national(self, filename, mutations):
     # Since we need national summary data, we can use the cache if it is available
-    data = uganda.load_dataset(filename)
+    data = uganda.load_national(filename)
     dates = data.days.unique().tolist()
     dates = [datetime.datetime(uganda.MODEL_YEAR, 1, 1) + datetime.timedelta(days=x) for x in dates]
 
-    for mutation in DATASET_LAYOUT['mutations'].keys():
+    for mutation in mutations:
       print('Creating national plot for {}...'.format(mutation))    
 
       # Calculate the frequency based on the current mutation
@@ -149,31 +137,21 @@ class median:
       if mutation == 'either':
         title = '{} / Total ART Resistance'.format(self.title)
         ylabel = 'Total ART Resistance Frequency'
-      image_filename = filename.split('/')[-1].replace('uga-policy-', '').replace('.csv', '')
+      image_filename = filename.split('/')[-1].replace('uga-policy-', '').replace(store.EXTENSION, '')
       image_filename += '-national-{}.png'.format(mutation)
 
       # Prepare the plot
       self.__plot_national(data, dates, ylabel, title, image_filename)
 
-    # Free the memory before returning
-    del data
-
   
   def __plot_national(self, data, dates, ylabel, title, filename):
 
-    # Get the frequency data and transpose it
-    frequencies = []
-    for replicate in data.replicate.unique():
-        row = data[data.replicate == replicate].frequency.tolist()
-        if len(frequencies) != 0:
-          frequencies = np.vstack((frequencies, row))
-        else:
-          frequencies = row
+    # Get the (replicate, date) frequency data, in the order of the dates
+    frequencies = data.pivot(index='replicate', columns='days', values='frequency')
+    frequencies = frequencies[data.days.unique()].to_numpy()
 
     # Calculate the median and IQR
-    upper = np.percentile(frequencies, 75, axis=0)
-    median = np.percentile(frequencies, 50, axis=0)
-    lower = np.percentile(frequencies, 25, axis=0)
+    lower, median, upper = quantiles.quantiles(frequencies, quantiles.IQR, self.approximate)
 
     # Setup and format the plot
     matplotlib.rc_file(uganda.LINE_CONFIGURATION)
@@ -195,13 +173,15 @@ class median:
 
 
 
-  def process(self, filename, title):
+  def process(self, filename, title, mutations = None):
     """Process the dataset in the file and generate three spaghetti plots.
     
-    dataset - The full or relative path to the file"""
+    dataset - The full or relative path to the file
+    mutations - The mutations to plot, default is all of DATASET_LAYOUT['mutations']"""
 
+    if mutations is None: mutations = list(DATASET_LAYOUT['mutations'].keys())
     self.title = title
 
     print('Creating median and IQR plots for: {}'.format(filename))
-    self.__districts(filename)
-    self.__national(filename)
+    self.__districts(filename, mutations)
+    self.__national(filename, mutations)
@@ -0,0 +1,131 @@
+# quantiles.py
+#
+# This file contains the quantile engine used by the median and IQR plots and the
+# summary tables. The quantiles are taken over the replicates, which are the first
+# axis of the values, for all of the remaining cells (e.g., dates and districts) in
+# a single call. For replicate counts that do not fit in memory the approximate mode
+# streams the replicates through the P-square estimator (Jain and Chlamtac, 1985),
+# which holds five markers per quantile per cell regardless of the number of
+# replicates.
+import numpy as np
+
+# The quantiles for the median and IQR, as percentiles
+IQR = [25, 50, 75]
+
+
+def quantiles(values, q, approximate = False, skipna = False):
+  """Return the (quantile, ...) percentiles of the values over the first axis.
+
+  values - Array-like with the replicates on the first axis, when approximate is
+    set only one replicate is accessed at a time, so memory-mapped arrays and
+    generators of replicates are not read into memory
+  q - The percentiles to return, in the range [0, 100]
+  approximate - True to use the streaming P-square estimator
+  skipna - True to ignore NaN values, otherwise any NaN makes the result NaN"""
+  if not approximate:
+    if skipna:
+      return np.nanpercentile(values, q, axis = 0)
+    return np.percentile(values, q, axis = 0)
+
+  estimator = None
+  for replicate in values:
+    replicate = np.asarray(replicate, dtype = float)
+    if estimator is None: estimator = stream(q, replicate.shape, skipna)
+    estimator.update(replicate)
+  return estimator.result()
+
+
+class stream:
+  """Streaming P-square estimator for a set of percentiles over each cell of an
+  array, the replicates are supplied one at a time to update."""
+
+  def __init__(self, q, shape, skipna = False):
+    self.q = np.asarray(q, dtype = float) / 100.0
+    self.shape = tuple(shape)
+    self.skipna = skipna
+    count = len(self.q)
+
+    # Observations seen per cell, and the cells that have seen a NaN
+    self.count = np.zeros(self.shape, dtype = np.int64)
+    self.missing = np.zeros(self.shape, dtype = bool)
+
+    # Marker heights and positions, and the desired positions and their increments,
+    # these are (quantile, marker, ...) arrays
+    self.heights = np.zeros((count, 5) + self.shape)
+    self.positions = np.zeros((count, 5) + self.shape)
+    self.desired = np.zeros((count, 5) + self.shape)
+    self.increments = np.stack([np.zeros(count), self.q / 2, self.q, (1 + self.q) / 2, np.ones(count)], axis = 1)
+    self.increments = self.increments.reshape(self.increments.shape + (1,) * len(self.shape))
+
+  def update(self, values):
+    """Add the values of a replicate, which has the shape of the cells."""
+    values = np.asarray(values, dtype = float)
+    valid = ~np.isnan(values)
+    if not self.skipna: self.missing |= ~valid
+
+    # The first five observations of each cell are held as the marker heights
+    filling = valid & (self.count < 5)
+    if filling.any():
+      index = np.nonzero(filling)
+      self.heights[(slice(None), self.count[index]) + index] = values[index]
+      self.count[index] += 1
+
+      # Initialize the markers of the cells that now have five observations
+      ready = filling & (self.count == 5)
+      if ready.any():
+        index = np.nonzero(ready)
+        self.heights[(slice(None), slice(None)) + index] = np.sort(self.heights[(slice(None), slice(None)) + index], axis = 1)
+        self.positions[(slice(None), slice(None)) + index] = np.arange(1, 6).reshape(1, 5, 1)
+        self.desired[(slice(None), slice(None)) + index] = (1 + 4 * self.increments[(slice(None), slice(None)) + (0,) * len(self.shape)])[..., None]
+
+    # The remaining cells are updated by the P-square estimator
+    active = valid & ~filling & (self.count >= 5)
+    if not active.any(): return
+    self.count[active] += 1
+    x = np.where(active, values, 0.0)[None]
+    heights, positions = self.heights, self.positions
+
+    # Find the cell of each observation, adjusting the extreme markers if needed
+    heights[:, 0] = np.where(active & (x < heights[:, 0]), x, heights[:, 0])
+    heights[:, 4] = np.where(active & (x > heights[:, 4]), x, heights[:, 4])
+    k = np.minimum((x[:, None] >= heights[:, 1:4]).sum(axis = 1), 3)
+
+    # Increment the positions of the markers above the cell, and the desired positions
+    marker = np.arange(5).reshape((1, 5) + (1,) * len(self.shape))
+    positions += active[None, None] & (marker > k[:, None])
+    self.desired += active[None, None] * self.increments
+
+    # Adjust the heights of the middle markers if they are off their desired position
+    for i in range(1, 4):
+      d = self.desired[:, i] - positions[:, i]
+      move = active[None] & (((d >= 1) & (positions[:, i + 1] - positions[:, i] > 1)) |
+                             ((d <= -1) & (positions[:, i - 1] - positions[:, i] < -1)))
+      if not move.any(): continue
+      s = np.sign(d)
+
+      # Piecewise parabolic prediction, falling back to linear if it is not monotonic
+      with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        above = (heights[:, i + 1] - heights[:, i]) / (positions[:, i + 1] - positions[:, i])
+        below = (heights[:, i] - heights[:, i - 1]) / (positions[:, i] - positions[:, i - 1])
+        parabolic = heights[:, i] + s / (positions[:, i + 1] - positions[:, i - 1]) * (
+          (positions[:, i] - positions[:, i - 1] + s) * above + (positions[:, i + 1] - positions[:, i] - s) * below)
+        linear = heights[:, i] + s * np.where(s > 0, above, below)
+      monotonic = (heights[:, i - 1] < parabolic) & (parabolic < heights[:, i + 1])
+      heights[:, i] = np.where(move, np.where(monotonic, parabolic, linear), heights[:, i])
+      positions[:, i] += np.where(move, s, 0)
+
+  def result(self):
+    """Return the (quantile, ...) estimates of the percentiles, cells with fewer than
+    five observations use the exact percentiles of those that were seen."""
+    result = self.heights[:, 2].copy()
+    small = self.count < 5
+    if small.any():
+      for count in np.unique(self.count[small]):
+        index = np.nonzero(self.count == count)
+        if count == 0:
+          result[(slice(None),) + index] = np.nan
+          continue
+        seen = self.heights[(slice(None), slice(0, count)) + index][0]
+        result[(slice(None),) + index] = np.percentile(seen, self.q * 100, axis = 0)
+    result[:, self.missing] = np.nan
+    return result
@@ -5,6 +5,8 @@ import datetime
 import os
 import numpy as np
 
+import include.endpoints as endpoints
+import include.quantiles as quantiles
 import include.uganda as uganda
 
 class summary:
@@ -27,20 +29,14 @@ class summary:
       date_string += '{:%Y},'.format(date + datetime.timedelta(days=int(point)))
       check_string += '\'{:%Y/%m},'.format(date + datetime.timedelta(days=int(point)))
 
-    # Iterate on each of the mutations
+    # Extract the frequencies of all of the mutations, then iterate on each of them
+    frequencies = endpoints.frequencies(data, list(uganda.DATASET_LAYOUT['mutations']), points)
     for mutation in uganda.DATASET_LAYOUT['mutations']:
       results = self.__prepare()
-      for key in uganda.LABELS.keys():       
-        for point in points:
-          # Calculate the frequency
-          data[key]['frequency'] = data[key][mutation] / data[key].infections
-          row = data[key][data[key].days == point].frequency
-
-          # Append the results
-          upper = np.percentile(row, 75)
-          median = np.percentile(row, 50)
-          lower = np.percentile(row, 25)
-          results[key] += '{:.2f} ({:.2f} - {:.2f}),'.format(median, lower, upper)
+      lower, median, upper = self.__iqr(frequencies[mutation], endpoints.replicates(data))
+      for policy, key in enumerate(uganda.LABELS.keys()):
+        for ndx in range(len(points)):
+          results[key] += '{:.2f} ({:.2f} - {:.2f}),'.format(median[policy, ndx], lower[policy, ndx], upper[policy, ndx])
 
       # Save the results
       os.makedirs('out', exist_ok=True)
@@ -51,6 +47,15 @@ class summary:
         out.write('\n' + check_string + '\n')
 
 
+  # Internal helper function to return the lower, median, and upper quartiles of the
+  # (policy, column, replicate) values. Only the replicates of each policy are used so
+  # the padding is dropped, but a replicate with no infections is still NaN and makes
+  # the result NaN, as np.percentile did.
+  def __iqr(self, values, counts):
+    result = [quantiles.quantiles(values[policy, :, :count].T, quantiles.IQR) for policy, count in enumerate(counts)]
+    return np.moveaxis(np.array(result), 1, 0)
+
+
   # Internal helper function to prepare dictionaries
   def __prepare(self):
     structure = {}
@@ -86,13 +91,11 @@ class summary:
     # Calculate the median, IQR for all of the treatment failures
     date_string, check_string = ',', 'record range,'
     treatment_failures = self.__prepare()
-    for time_span in ranges:
-      results = self.__get_treatment_failures(data, time_span)
-      for key in uganda.LABELS.keys():
-        upper = np.percentile(results[key], 75)
-        median = np.percentile(results[key], 50)
-        lower = np.percentile(results[key], 25)
-        treatment_failures[key] += '{:.2f} ({:.2f} - {:.2f}),'.format(median, lower, upper)
+    results = endpoints.treatment_failures(data, ranges)
+    lower, median, upper = self.__iqr(results, endpoints.replicates(data))
+    for ndx, time_span in enumerate(ranges):
+      for policy, key in enumerate(uganda.LABELS.keys()):
+        treatment_failures[key] += '{:.2f} ({:.2f} - {:.2f}),'.format(median[policy, ndx], lower[policy, ndx], upper[policy, ndx])
 
       # Append the date for the results, and the range used to calculate them
       date_string += '{:%Y},'.format(date + datetime.timedelta(days=int(time_span[0])))
@@ -107,24 +110,3 @@ class summary:
       for key, format in uganda.LABELS.items():
         out.write('{},{}\n'.format(format[0], treatment_failures[key]))
       out.write('\n' + check_string + '\n')
-
-
-  # Get the treatment failures for the defined time frame
-  def __get_treatment_failures(self, data, dates):
-    # Start by generating the data to plot
-    results = {}
-    for key in uganda.LABELS.keys():
-      row = []
-      for replicate in data[key].replicate.unique():
-        # Filter on the dataset to get this replicate
-        subset = data[key][data[key].replicate == replicate]
-
-        # Filter on the replicate to get sum of treatments, failures
-        treatments = np.sum(subset[(subset.days >= dates[0]) & (subset.days <= dates[-1])].treatments)
-        failures = np.sum(subset[(subset.days >= dates[0]) & (subset.days <= dates[-1])].failures)
-
-        # Treatment failures is returned as percentage
-        row.append((failures / treatments) * 100.0)
-      results[key] = row
-    return results    
-      
\ No newline at end of file
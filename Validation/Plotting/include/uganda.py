@@ -1,29 +1,46 @@
 # uganda.py
 #
 # This file contains common properties for Uganda and associated reporting and plots.
+import collections
+import hashlib
+import json
 import numpy as np
 import os
 import pandas as pd
+import re
 import sys
 
-# From the PSU-CIDD-MaSim-Support repository
-sys.path.insert(1, '../../PSU-CIDD-MaSim-Support/Python/include')
-from utility import progressBar
+# The columnar store is shared with the Analysis scripts
+sys.path.insert(1, '../Analysis/include')
+import cube
+import store
 
 # Connection string for the database
 CONNECTION = 'host=masimdb.vmhost.psu.edu dbname=uganda user=sim password=sim connect_timeout=60'
 
-# The column layout of the dataset files
+# The columns of the dataset files, see store.SCHEMA for the full layout
 DATASET_LAYOUT = {
-    'replicate'     : 1,
-    'dates'         : 2,
-    'district'      : 3,
-    'infections'    : 4,
-    'mutations'     : { '469Y' : 8, '675V' : 11, 'either' : 14 }
+    'replicate'     : 'replicateid',
+    'dates'         : 'dayselapsed',
+    'district'      : 'district',
+    'infections'    : 'infectedindividuals',
+    'treatments'    : 'treatments',
+    'failures'      : 'treatmentfailures',
+    'mutations'     : { '469Y' : 'weightedoccurrences_469y', '675V' : 'weightedoccurrences_675v', 'either' : 'weightedsum' }
 }
 
-# The mapping file for the districts
-DISTRICTS_MAPPING = '../GIS/administrative/uga_districts.csv'
+# The most memory the datasets held by the registry may use before the least 
+# recently used are evicted
+REGISTRY_LIMIT = 4 * 1024 ** 3
+
+# The cache of the national summaries, the version must be incremented whenever 
+# the contents of the cache files change so the existing entries are rebuilt
+CACHE_DIRECTORY = 'cache'
+CACHE_INDEX = 'index.json'
+CACHE_VERSION = 2
+
+# Block size to use when calculating checksums
+BLOCK_SIZE = 1024 * 1024
 
 # The following are the labels and colors for the various configurations
 LABELS = {
@@ -43,67 +60,151 @@ LABELS = {
 # First year of model execution
 MODEL_YEAR = 2004
 
-# Template and paths for the mutations
-MUTATIONS_TEMPLATE = '../GIS/mutations/uga_{}_mutations.csv'
-MUTATIONS_469Y = '../GIS/mutations/uga_469y_mutations.csv'
-MUTATIONS_675V = '../GIS/mutations/uga_675v_mutations.csv'
-
 # Settings for plots
 LINE_CONFIGURATION = 'include/matplotlibrc-line'
 VIOLIN_CONFIGURATION = 'include/matplotlibrc-violin'
 
+class registry:
+    """Process-wide cache of the loaded datasets so that each file is only parsed
+    once per run, the least recently used datasets are evicted once the memory
+    they use exceeds the limit. NOTE that the data frames are shared, so callers
+    may add derived columns but should not otherwise modify them, the sizes are
+    measured again on each access so the derived columns count towards the limit."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.entries = collections.OrderedDict()
+
+    @staticmethod
+    def size(data):
+        """Return the memory used by the dataset in bytes."""
+        if isinstance(data, pd.DataFrame):
+            return int(data.memory_usage(deep=True).sum())
+        return data.nbytes
+
+    def get(self, key, load):
+        """Return the dataset for the key, calling load() to create it if need be."""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            data = self.entries[key]
+        else:
+            data = load()
+            self.entries[key] = data
+
+        # Measure the datasets again since columns may have been added to them, then
+        # evict until we are under the limit, but always keep the dataset requested
+        self.used = sum(self.size(entry) for entry in self.entries.values())
+        while self.used > self.limit and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.used -= self.size(evicted)
+        return data
+
+    def clear(self):
+        self.entries.clear()
+        self.used = 0
+
+# The registry shared by all of the plots
+DATASETS = registry(REGISTRY_LIMIT)
+
+
+def load_national(dataset):
+    """Return the national summary of the dataset, see load_dataset()"""
+    return DATASETS.get(('national', os.path.abspath(dataset)), lambda: load_dataset(dataset))
+
+
+def load_districts(dataset):
+    """Return the district level data of the dataset as a cube, which is built in
+    the cache directory when the dataset changes"""
+    def load():
+        # Remove the cubes of the datasets that no longer exist before building
+        path = os.path.dirname(dataset) or '.'
+        cube.clean(CACHE_DIRECTORY, [file for file in os.listdir(path) if file.endswith(store.EXTENSION)])
+        return cube.load(dataset, CACHE_DIRECTORY)
+
+    os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+    return DATASETS.get(('districts', os.path.abspath(dataset)), load)
+
+
 def load_all_datasets():
     DATASETS_PATH = '../Analysis/data/datasets'
 
     datasets = {}
     for file in os.listdir(DATASETS_PATH):
-        key = file.split('/')[-1].replace('uga-policy-', '').replace('.csv', '')
-        datasets[key] = load_dataset(os.path.join(DATASETS_PATH, file))
+        if not file.endswith(store.EXTENSION): continue
+        key = file.split('/')[-1].replace('uga-policy-', '').replace(store.EXTENSION, '')
+        datasets[key] = load_national(os.path.join(DATASETS_PATH, file))
     return datasets, datasets[key].days.unique()
 
 
-def load_dataset(dataset):
-    REPLICATE, DATES, DISTRICT, INFECTIONS, TREATMENTS, FAILURES = 1, 2, 3, 4, 12, 13
-    MUTATION_MAPPING = { '469Y' : 8, '675V' : 11, 'either' : 14 }
-    CACHE_DIRECTORY = 'cache/'
+def fingerprint(dataset):
+    """Return the key of the cache entry for the dataset, a hash of the size, time
+    stamp, and contents of the file along with the cache version. The hash of the
+    contents is kept in the cache index so it is only calculated when the file changes."""
+    stat = os.stat(dataset)
+    path = os.path.abspath(dataset)
+    index_file = os.path.join(CACHE_DIRECTORY, CACHE_INDEX)
+    index = {}
+    if os.path.exists(index_file):
+        try:
+            with open(index_file, 'r') as file: index = json.load(file)
+        except ValueError:
+            # Partially written index, the checksums will be recalculated
+            pass
+
+    entry = index.get(path)
+    if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime_ns:
+        hash = hashlib.sha256()
+        with open(dataset, 'rb') as file:
+            for block in iter(lambda: file.read(BLOCK_SIZE), b''):
+                hash.update(block)
+        entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'checksum': hash.hexdigest()}
+        index[path] = entry
+
+        # Write the index under a temporary name so it is never left partially written
+        temporary = index_file + '.tmp'
+        with open(temporary, 'w') as file: json.dump(index, file)
+        os.replace(temporary, index_file)
+
+    key = '{}:{}:{}:{}'.format(CACHE_VERSION, entry['size'], entry['mtime'], entry['checksum'])
+    return hashlib.sha256(key.encode()).hexdigest()
 
-    # Check to see if the cache exists, load and return if it does
-    filename = dataset.split('/')[-1].replace('uga-policy-', '').replace('.csv', '')
-    cache_file = os.path.join(CACHE_DIRECTORY, filename + '-cache.csv')
+
+def load_dataset(dataset):
+    REPLICATE, DATES, INFECTIONS = DATASET_LAYOUT['replicate'], DATASET_LAYOUT['dates'], DATASET_LAYOUT['infections']
+    TREATMENTS, FAILURES = DATASET_LAYOUT['treatments'], DATASET_LAYOUT['failures']
+    MUTATION_MAPPING = DATASET_LAYOUT['mutations']
+
+    # Check to see if the cache entry for this version of the dataset exists, load and return if it does
+    os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+    filename = dataset.split('/')[-1].replace('uga-policy-', '').replace(store.EXTENSION, '')
+    key = fingerprint(dataset)[:16]
+    cache_file = os.path.join(CACHE_DIRECTORY, '{}-{}.npz'.format(filename, key))
     if os.path.exists(cache_file):
-        return pd.read_csv(cache_file)
+        with np.load(cache_file) as archive:
+            return pd.DataFrame({ column : archive[column] for column in archive.files })
 
     # Inform the user
     print('Create cache for {}...'.format(filename))
 
     # The cache does not exist, start by loading the full dataset
-    data = pd.read_csv(dataset, header=None)
-    dates = data[DATES].unique().tolist()
-    replicates = data[REPLICATE].unique()
-
-    # Parse the data into a list of dictionaries
-    rows = []
-    for replicate in replicates:
-        for date in dates:
-
-            # Filter on this combination
-            subset = data[(data[REPLICATE] == replicate) & (data[DATES] == date)]
-
-            # Parse the simple items, create the row
-            treatments = np.sum(subset[TREATMENTS])
-            failures = np.sum(subset[FAILURES])
-            infections = np.sum(subset[INFECTIONS])
-            row = {'replicate': replicate, 'days': date, 'treatments': treatments, 'failures': failures, 'infections': infections}
-
-            # Append the mutation data to the row
-            for mutation, index in MUTATION_MAPPING.items():
-                row[mutation] = np.sum(subset[index])
-
-            # Append the row to the rows and note the status
-            rows.append(row)
-            progressBar(len(rows), len(dates) * len(replicates))
-
-    # Copy the data to the data frame, save, and return the data
-    df = pd.DataFrame(rows)
-    df.to_csv(cache_file, index=False)
-    return df
\ No newline at end of file
+    data = store.read(dataset, [REPLICATE, DATES, INFECTIONS, TREATMENTS, FAILURES] + list(MUTATION_MAPPING.values()))
+
+    # Sum over the districts for each replicate and date in a single pass, the
+    # groups are kept in the order they appear in the dataset
+    columns = {TREATMENTS: 'treatments', FAILURES: 'failures', INFECTIONS: 'infections'}
+    columns.update({index: mutation for mutation, index in MUTATION_MAPPING.items()})
+    df = data.groupby([REPLICATE, DATES], sort=False)[list(columns.keys())].sum()
+    df = df.rename(columns=columns).reset_index().rename(columns={REPLICATE: 'replicate', DATES: 'days'})
+
+    # Remove the stale entries for the dataset, including those from before the cache was versioned
+    stale = re.compile(r'^{}-([0-9a-f]{{16}}\.npz|cache\.csv)$'.format(re.escape(filename)))
+    for file in os.listdir(CACHE_DIRECTORY):
+        if stale.match(file): os.remove(os.path.join(CACHE_DIRECTORY, file))
+
+    # Save under a temporary name so the entry is never left partially written, then return the data
+    temporary = cache_file + '.tmp'
+    with open(temporary, 'wb') as file:
+        np.savez(file, **{ column : df[column].to_numpy() for column in df.columns })
+    os.replace(temporary, cache_file)
+    return df
@@ -9,25 +9,23 @@ import numpy as np
 import os
 import seaborn as sb
 
+import include.endpoints as endpoints
 import include.uganda as uganda
 
 class violin:
   DIRECTORY = os.path.join('out', 'violin')
 
-  ENDPOINTS = {
-    # Endpoint : First Date Offset, Last Date Offset, Numeric Value
-    'Three' : [-96, -84, 3],
-    'Five'  : [-72, -60, 5],
-    'Ten'   : [-12, None, 10]
-  }
+  ENDPOINTS = endpoints.ENDPOINTS
 
   def treatment_failures(self):
     """Generate the 3, 5, and 10 year endpoint treatment failure violin plots"""
     data, dates = uganda.load_all_datasets()
 
     print('Preparing treatment failure plots...')
-    for endpoint, bounds in self.ENDPOINTS.items():
-      range = dates[bounds[0]:bounds[1]]
+    ranges = [dates[bounds[0]:bounds[1]] for bounds in self.ENDPOINTS.values()]
+    results = endpoints.treatment_failures(data, ranges)
+    for ndx, (endpoint, bounds) in enumerate(self.ENDPOINTS.items()):
+      range = ranges[ndx]
       
       # Offer some validation that this the correct bounds  
       date = datetime.datetime(uganda.MODEL_YEAR, 1, 1)
@@ -37,30 +35,27 @@ class violin:
 
       # Prepare the actual plot
       filename = 'treatment-failures-{}-year.png'.format(bounds[2])
-      self.__plot_failures(data, range, filename)
+      self.__plot_failures(self.__records(data, results[:, ndx]), filename)
 
 
-  def __plot_failures(self, data, dates, filename):
+  def prepare_failures(self, data, dates):
+    """Return the treatment failure records, labels, and colors for the policies over the dates"""
+    return self.__records(data, endpoints.treatment_failures(data, [dates])[:, 0])
 
-    # Start by generating the data to plot
-    records, labels, colors = [], [], []
-    for key, format in uganda.LABELS.items():
-      row = []
-      for replicate in data[key].replicate.unique():
-        # Filter on the dataset to get this replicate
-        subset = data[key][data[key].replicate == replicate]
-
-        # Filter on the replicate to get sum of treatments, failures
-        treatments = np.sum(subset[(subset.days >= dates[0]) & (subset.days <= dates[-1])].treatments)
-        failures = np.sum(subset[(subset.days >= dates[0]) & (subset.days <= dates[-1])].failures)
 
-        # Treatment failures is returned as percentage
-        row.append((failures / treatments) * 100.0)
-
-      # Append the processed data
+  def __records(self, data, results):
+    # Convert the (policy, replicate) results to the records, labels, and colors to plot,
+    # only the padding is removed so replicates with no infections are still NaN
+    records, labels, colors = [], [], []
+    for ndx, (format, count) in enumerate(zip(uganda.LABELS.values(), endpoints.replicates(data))):
+      records.append(results[ndx, :count].tolist())
       labels.append(format[0])
       colors.append(format[1])
-      records.append(row)
+    return records, labels, colors
+
+
+  def __plot_failures(self, prepared, filename):
+    records, labels, colors = prepared
 
     # Generate the plot
     matplotlib.rc_file(uganda.VIOLIN_CONFIGURATION)
@@ -86,33 +81,31 @@ class violin:
   def frequencies(self):
     """Generate the 3, 5, and 10 year endpoint frequency plots"""
     data, dates = uganda.load_all_datasets()
+
+    # Extract the frequencies for all of the alleles and endpoints at once
+    alleles = ['469Y', '675V', 'either']
+    points = [dates[bounds[0]:bounds[1]][-1] for bounds in self.ENDPOINTS.values()]
+    results = endpoints.frequencies(data, alleles, points)
     
-    for allele in ['469Y', '675V', 'either']:
+    for allele in alleles:
       print('Generating {} allele plots...'.format(allele))
-      for endpoint, bounds in self.ENDPOINTS.items():
-        range = dates[bounds[0]:bounds[1]]
-              
+      for ndx, (endpoint, bounds) in enumerate(self.ENDPOINTS.items()):
         # Offer some validation that this the correct bounds  
         date = datetime.datetime(uganda.MODEL_YEAR, 1, 1)
-        print('{} Year: {:%Y-%m}'.format(endpoint, date + datetime.timedelta(days=int(range[-1]))))
+        print('{} Year: {:%Y-%m}'.format(endpoint, date + datetime.timedelta(days=int(points[ndx]))))
 
         # Prepare the actual plot
         filename = 'frequency-{}-{}-year.png'.format(allele, bounds[2])
-        self.__plot_frequencies(data, allele, range[-1], filename)
+        self.__plot_frequencies(self.__records(data, results[allele][:, ndx]), allele, filename)
 
 
-  def __plot_frequencies(self, data, allele, date, filename):
+  def prepare_frequencies(self, data, allele, date):
+    """Return the allele frequency records, labels, and colors for the policies on the date"""
+    return self.__records(data, endpoints.frequencies(data, [allele], [date])[allele][:, 0])
 
-    # Start by generating the data to plot
-    records, labels, colors = [], [], []
-    for key, format in uganda.LABELS.items():
-      data[key]['frequency'] =  data[key][allele] / data[key].infections
-      row = data[key][data[key].days == date].frequency
-      
-      # Append the processed data
-      labels.append(format[0])
-      colors.append(format[1])
-      records.append(row)
+
+  def __plot_frequencies(self, prepared, allele, filename):
+    records, labels, colors = prepared
 
     # Generate the plot
     matplotlib.rc_file(uganda.VIOLIN_CONFIGURATION)
@@ -3,33 +3,95 @@
 # plot_astmh.py
 #
 # Plot the calibration and violin plots for the ASTMH poster.
+import argparse
+import concurrent.futures
+import glob
+import matplotlib
 import os
 
+import include.uganda as uganda
 from include.spaghetti import spaghetti
 from include.summary import summary
 from include.median import median
 from include.violin import violin
 
+# The directory and pattern of the policy datasets
+DATASETS_DIRECTORY = '../Analysis/data/datasets'
+DATASETS_PATTERN = 'uga-policy-*.npz'
+
+# The plots generated for each policy
+PLOTS = { 'spaghetti' : spaghetti, 'median' : median }
+
+
+def discover(directory = DATASETS_DIRECTORY):
+  """Return the (filename, title) of the policy datasets in the directory, the
+  policies in uganda.LABELS are first and in that order, followed by any others."""
+  policies = {}
+  for filename in glob.glob(os.path.join(directory, DATASETS_PATTERN)):
+    key = os.path.basename(filename).replace('uga-policy-', '').replace('.npz', '')
+    policies[key] = filename
+  order = [key for key in uganda.LABELS if key in policies] + sorted(key for key in policies if key not in uganda.LABELS)
+  return [(policies[key], uganda.LABELS[key][0] if key in uganda.LABELS else key) for key in order]
+
+
+def make_plots(plots, policies):
+  # Run all of the plots for a policy before moving to the next one, so the
+  # district data only needs to be held in the dataset registry once
+  for filename, title in policies:
+    for plot in plots:
+      plot.process(filename, title)
+
+
+def _initialize():
+  # Each worker renders off screen, so the interactive backend is never started
+  matplotlib.use('Agg')
+
+
+def _render(plot, filename, title, mutation):
+  PLOTS[plot]().process(filename, title, [mutation])
+
+
+def _summary(name):
+  if name == 'summary':
+    summary().generate()
+  else:
+    getattr(violin(), name)()
+
+
+def render_plots(policies, jobs):
+  """Render the figures using a pool of jobs processes, each policy and mutation is
+  a separate job, as are the violin plots and summary."""
+  # Build any missing caches before starting, so the workers only read them
+  for filename, _ in policies:
+    uganda.load_national(filename)
+    uganda.load_districts(filename)
+  uganda.DATASETS.clear()
+
+  with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=_initialize) as executor:
+    futures = []
+    for filename, title in policies:
+      for plot in PLOTS:
+        for mutation in uganda.DATASET_LAYOUT['mutations']:
+          futures.append(executor.submit(_render, plot, filename, title, mutation))
+    for name in ['treatment_failures', 'frequencies', 'summary']:
+      futures.append(executor.submit(_summary, name))
+
+    # Wait for the figures, raising the first error encountered
+    for future in concurrent.futures.as_completed(futures):
+      future.result()
+
 
-def make_plots(plot):
-  plot.process('../Analysis/data/datasets/uga-policy-status-quo.csv', 'Status Quo')
-  
-  plot.process('../Analysis/data/datasets/uga-policy-mft-al-25-asaq-75.csv', 'AL (25%) + ASAQ (75%)')
-  plot.process('../Analysis/data/datasets/uga-policy-mft-al-50-asaq-50.csv', 'AL (50%) + ASAQ (50%)')
-  plot.process('../Analysis/data/datasets/uga-policy-mft-al-75-asaq-25.csv', 'AL (75%) + ASAQ (25%)')
-  plot.process('../Analysis/data/datasets/uga-policy-mft-al-75-dhappq-25.csv', 'AL (75%) + DHA-PPQ (25%)')
-  plot.process('../Analysis/data/datasets/uga-policy-mft-asaq-75-dhappq-25.csv', 'ASAQ (75%) + DHA-PPQ (25%)')
-  
-  plot.process('../Analysis/data/datasets/uga-policy-sft-al.csv', 'AL')
-  plot.process('../Analysis/data/datasets/uga-policy-sft-asaq.csv', 'ASAQ')
-  plot.process('../Analysis/data/datasets/uga-policy-sft-dhappq.csv', 'DHA-PPQ')
-  
-  plot.process('../Analysis/data/datasets/uga-policy-tact-alaq.csv', 'ALAQ')
-  plot.process('../Analysis/data/datasets/uga-policy-tact-asmqppq.csv', 'ASMQ-PPQ')
-  
 if __name__ == '__main__':
-  make_plots(spaghetti())
-  make_plots(median())
-  violin().treatment_failures()
-  violin().frequencies()
-  summary().generate()
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-j', '--jobs', action='store', dest='jobs', type=int, default=1,
+    help='The number of processes to render the figures with (default 1)')
+  args = parser.parse_args()
+
+  policies = discover()
+  if args.jobs > 1:
+    render_plots(policies, args.jobs)
+  else:
+    make_plots([spaghetti(), median()], policies)
+    violin().treatment_failures()
+    violin().frequencies()
+    summary().generate()
@@ -0,0 +1,45 @@
+# test_endpoints.py
+#
+# Tests for the extraction of the endpoint values from the national datasets.
+import numpy as np
+import pandas as pd
+import pytest
+
+import include.endpoints as endpoints
+
+# The reporting days of the synthetic policies
+DAYS = [30, 60, 90, 120]
+
+
+def national(replicates, infections = 10.0):
+  # Return a national dataset with the replicates, the 469Y occurrences are the day
+  # so the frequency on each day is known
+  rows = []
+  for replicate in range(replicates):
+    for day in DAYS:
+      rows.append({ 'replicate' : replicate, 'days' : day, 'infections' : infections, '469Y' : day / 1000.0,
+        'treatments' : 100.0, 'failures' : float(replicate + 1) })
+  return pd.DataFrame(rows)
+
+
+def test_frequencies():
+  data = { 'a' : national(2), 'b' : national(3) }
+  result = endpoints.frequencies(data, ['469Y'], [60, 120], keys = ['a', 'b'])['469Y']
+  assert result.shape == (2, 2, 3)
+  assert np.allclose(result[:, 0, :2], 0.006) and np.allclose(result[:, 1, :2], 0.012)
+
+  # The policy with fewer replicates is padded
+  assert np.isnan(result[0, :, 2]).all() and not np.isnan(result[1]).any()
+  assert endpoints.replicates(data, keys = ['a', 'b']) == [2, 3]
+
+
+@pytest.mark.parametrize('date', [45, 121, 0])
+def test_frequencies_require_reported_dates(date):
+  with pytest.raises(ValueError):
+    endpoints.frequencies({ 'a' : national(2) }, ['469Y'], [60, date], keys = ['a'])
+
+
+def test_treatment_failures():
+  data = { 'a' : national(2) }
+  result = endpoints.treatment_failures(data, [DAYS[:2], DAYS], keys = ['a'])
+  assert np.allclose(result[0, :, 0], 1.0) and np.allclose(result[0, :, 1], 2.0)
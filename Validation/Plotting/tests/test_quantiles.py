@@ -0,0 +1,51 @@
+# test_quantiles.py
+#
+# Tests for the quantile engine against the NumPy percentiles.
+import numpy as np
+import pytest
+
+from include.quantiles import IQR, quantiles, stream
+
+
+def test_exact():
+  values = np.random.default_rng(1).normal(size = (50, 4, 3))
+  assert np.allclose(quantiles(values, IQR), np.quantile(values, np.array(IQR) / 100, axis = 0))
+
+
+def test_exact_skipna():
+  values = np.random.default_rng(2).normal(size = (20, 5))
+  values[3, 1] = np.nan
+  assert np.isnan(quantiles(values, IQR)[:, 1]).all()
+  assert np.allclose(quantiles(values, IQR, skipna = True), np.nanquantile(values, np.array(IQR) / 100, axis = 0))
+
+
+@pytest.mark.parametrize('distribution', ['normal', 'uniform', 'exponential'])
+def test_approximate(distribution):
+  # The P-square estimates should be close to the exact quantiles for large samples
+  values = getattr(np.random.default_rng(3), distribution)(size = (5000, 3, 2))
+  exact = np.quantile(values, np.array(IQR) / 100, axis = 0)
+  approximate = quantiles(values, IQR, approximate = True)
+  assert approximate.shape == exact.shape
+  assert np.allclose(approximate, exact, atol = 0.05 * np.ptp(values))
+
+
+def test_approximate_generator():
+  # Replicates are only accessed one at a time, so a generator can be used
+  values = np.random.default_rng(4).normal(size = (1000, 6))
+  result = quantiles((replicate for replicate in values), [50], approximate = True)
+  assert np.allclose(result, np.median(values, axis = 0), atol = 0.1)
+
+
+def test_approximate_few_replicates():
+  # Cells with fewer than five observations use the exact percentiles
+  values = np.random.default_rng(5).normal(size = (3, 4))
+  assert np.allclose(quantiles(values, IQR, approximate = True), np.percentile(values, IQR, axis = 0))
+
+
+def test_approximate_missing():
+  values = np.random.default_rng(6).normal(size = (200, 2))
+  values[10, 0] = np.nan
+  assert np.isnan(quantiles(values, [50], approximate = True)[0, 0])
+  estimator = stream([50], (2,), skipna = True)
+  for replicate in values: estimator.update(replicate)
+  assert np.allclose(estimator.result(), np.nanmedian(values, axis = 0), atol = 0.15)
@@ -0,0 +1,49 @@
+# test_summary.py
+#
+# Tests for the summary tables, in particular the replicates that the quartiles are
+# taken over when the policies have different numbers of replicates.
+import numpy as np
+import pandas as pd
+
+import include.summary as summary
+import include.uganda as uganda
+
+# The summary covers the last 15 years of monthly data
+DAYS = [30 * (ndx + 1) for ndx in range(180)]
+
+
+def national(frequencies, infections):
+  # Return a national dataset with a replicate for each of the frequencies
+  rows = []
+  for replicate, (frequency, infected) in enumerate(zip(frequencies, infections)):
+    for day in DAYS:
+      rows.append({ 'replicate' : replicate, 'days' : day, 'infections' : infected, 'treatments' : 100.0, 'failures' : 10.0,
+        '469Y' : frequency * infected, '675V' : frequency * infected, 'either' : frequency * infected })
+  return pd.DataFrame(rows)
+
+
+def generate(tmp_path, monkeypatch, data):
+  # Generate the summary for the data and return the 469Y row of each policy
+  monkeypatch.chdir(tmp_path)
+  monkeypatch.setattr(uganda, 'LABELS', { key : [key, '#000000'] for key in data })
+  monkeypatch.setattr(uganda, 'load_all_datasets', lambda: (data, np.array(DAYS)))
+  summary.summary().generate()
+  with open(tmp_path / 'out' / '469Y.csv') as file:
+    return { line.split(',')[0] : line.strip().split(',')[1:-1] for line in file if line.split(',')[0] in data }
+
+
+def test_padding_is_dropped(tmp_path, monkeypatch):
+  # Policy a has fewer replicates, so it is padded by the endpoints
+  data = { 'a' : national([0.1, 0.3], [10.0, 10.0]), 'b' : national([0.1, 0.2, 0.3], [10.0, 10.0, 10.0]) }
+  rows = generate(tmp_path, monkeypatch, data)
+  assert rows['a'][-1] == '0.20 (0.15 - 0.25)'
+  assert rows['b'][-1] == '0.20 (0.15 - 0.25)'
+
+
+def test_replicate_without_infections(tmp_path, monkeypatch):
+  # A replicate with no infections has a 0/0 frequency, which is NaN as it was with
+  # np.percentile rather than being dropped like the padding
+  data = { 'a' : national([0.1, 0.3, 0.2], [10.0, 0.0, 10.0]), 'b' : national([0.1, 0.3], [10.0, 10.0]) }
+  rows = generate(tmp_path, monkeypatch, data)
+  assert rows['a'][-1] == 'nan (nan - nan)'
+  assert rows['b'][-1] == '0.20 (0.15 - 0.25)'
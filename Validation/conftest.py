@@ -0,0 +1,12 @@
+# conftest.py
+#
+# Shared setup for the Analysis and Plotting tests. The scripts are run from their
+# own directories and import the include files relative to them, and the Plotting
+# scripts import the columnar store directly from Analysis/include, so the same
+# paths are added here regardless of the directory pytest is run from.
+import os
+import sys
+
+VALIDATION = os.path.dirname(os.path.abspath(__file__))
+for path in ['Analysis', os.path.join('Analysis', 'include'), 'Plotting']:
+  sys.path.insert(1, os.path.join(VALIDATION, path))